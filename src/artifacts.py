@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import array
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# gensim stores every numpy attribute above sep_limit bytes as a separate .npy file that can be memory-mapped
+sep_limit = 0
+
+def save_model(model, path):
+    model.save(path, sep_limit=sep_limit)
+
+def load_model(model_class, path, mmap='r'):
+    return model_class.load(path, mmap=mmap)
+
+# tokens buffered before they are written out, memory stays bounded whatever the corpus size
+docs_buffer_size = 1000000
+
+def save_docs(path, documents):
+    # token lists stored as one flat int32 id file, document boundaries in an int64 offset file and the id -> token vocabulary
+    # the files are raw arrays written as the documents come in, so they can be memory-mapped and appended to
+    vocab = {}
+    ids = array.array('i')
+    offsets = array.array('q', [0])
+    count = 0
+    with open(path + '.ids', 'wb') as ids_file, open(path + '.offsets', 'wb') as offsets_file:
+        for doc in documents:
+            ids.extend(vocab.setdefault(token, len(vocab)) for token in doc)
+            count += len(doc)
+            offsets.append(count)
+            if len(ids) >= docs_buffer_size or len(offsets) >= docs_buffer_size:
+                ids.tofile(ids_file)
+                offsets.tofile(offsets_file)
+                del ids[:]
+                del offsets[:]
+        ids.tofile(ids_file)
+        offsets.tofile(offsets_file)
+    with open(path + '.vocab', 'w') as vocab_file:
+        vocab_file.writelines(token + '\n' for token in sorted(vocab, key=vocab.get))
+
+def append_docs(path, documents):
+    # the documents of an update go to the end of the stored files, the ids and tokens already stored stay as they are
+    with open(path + '.vocab', 'r') as vocab_file:
+        vocab = dict((token, i) for i, token in enumerate(vocab_file.read().splitlines()))
+    num_tokens = len(vocab)
+    count = int(load_array(path + '.offsets', np.int64)[-1])
+    ids = array.array('i')
+    offsets = array.array('q')
+    for doc in documents:
+        ids.extend(vocab.setdefault(token, len(vocab)) for token in doc)
+        count += len(doc)
+        offsets.append(count)
+    with open(path + '.ids', 'ab') as ids_file:
+        ids.tofile(ids_file)
+    with open(path + '.offsets', 'ab') as offsets_file:
+        offsets.tofile(offsets_file)
+    with open(path + '.vocab', 'a') as vocab_file:
+        vocab_file.writelines(token + '\n' for token in sorted(vocab, key=vocab.get)[num_tokens:])
+
+def load_array(path, dtype, mmap_mode='r'):
+    if mmap_mode is None or os.path.getsize(path) == 0:
+        return np.fromfile(path, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mmap_mode)
+
+def load_docs(path, mmap_mode='r'):
+    return DocumentArray(path, mmap_mode=mmap_mode)
+
+class DocumentArray(object):
+    def __init__(self, path, mmap_mode='r'):
+        self.ids = load_array(path + '.ids', np.int32, mmap_mode)
+        self.offsets = load_array(path + '.offsets', np.int64, mmap_mode)
+        with open(path + '.vocab', 'r') as vocab_file:
+            self.vocab = vocab_file.read().splitlines()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return [self.vocab[i] for i in self.ids[self.offsets[index]:self.offsets[index + 1]]]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+def save_embeddings(path, keys, embeddings):
+    # one float32 row per key, the row order is given by the keys file
+    np.save(path + '.npy', np.ascontiguousarray(embeddings, dtype=np.float32))
+    keys.to_csv(path + '.keys.csv', index=False)
+
+def load_embeddings(path, mmap_mode='r'):
+    return pd.read_csv(path + '.keys.csv'), np.load(path + '.npy', mmap_mode=mmap_mode)
+
+def save_matrix(path, keys, features, labels, metadata):
+    # row-major float32 features and 0/1 labels share the row order of the keys file, metadata describes the feature columns
+    np.save(path + '.features.npy', np.ascontiguousarray(features, dtype=np.float32))
+    np.save(path + '.labels.npy', np.ascontiguousarray(labels, dtype=np.int8))
+    keys.to_csv(path + '.keys.csv', index=False)
+    with open(path + '.columns.json', 'w') as metadata_file:
+        json.dump(metadata, metadata_file, indent=2)
+
+def load_matrix(path, mmap_mode='r'):
+    with open(path + '.columns.json', 'r') as metadata_file:
+        metadata = json.load(metadata_file)
+    return (pd.read_csv(path + '.keys.csv'),
+            np.load(path + '.features.npy', mmap_mode=mmap_mode),
+            np.load(path + '.labels.npy', mmap_mode=mmap_mode),
+            metadata)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+
+article_file = 'data/raw/ARTICLE.csv'
+author_index = None
+
+def split_authors(author_string):
+    if pd.isnull(author_string):
+        return []
+    return [author.strip() for author in author_string.split(' and ') if author.strip()]
+
+def surname(author):
+    # bibtex names are "Last, First", "First Last" or a braced organisation name
+    if author.startswith('{') and author.endswith('}'):
+        return author[1:-1].strip()
+    if ',' in author:
+        return author[:author.index(',')].strip()
+    return author.split()[-1]
+
+def surnames(author_string):
+    return [surname(author) for author in split_authors(author_string)]
+
+def normalize(name):
+    return name.replace('{', '').replace('}', '').strip().lower()
+
+def build_author_index(ARTICLE):
+    index = ARTICLE.drop_duplicates('citation_key').set_index('citation_key')['author']
+    return index.map(lambda author_string: frozenset(normalize(name) for name in surnames(author_string)))
+
+def load_author_index():
+    global author_index
+    if author_index is None:
+        author_index = build_author_index(pd.read_csv(article_file, usecols=['citation_key', 'author']))
+    return author_index
+
+def author_table(index):
+    # one row per citation key and surname token
+    table = index.map(list).explode().dropna()
+    return pd.DataFrame({'citation_key': table.index, 'surname': table.values})
+
+def share_author(pairs, left_key, right_key, index=None):
+    index = load_author_index() if index is None else index
+    table = author_table(index)
+    left = pd.merge(pd.DataFrame({'pair': pairs.index, 'citation_key': pairs[left_key].values}), table, on='citation_key')
+    right = pd.merge(pd.DataFrame({'pair': pairs.index, 'citation_key': pairs[right_key].values}), table, on='citation_key')
+    shared = pd.merge(left[['pair', 'surname']], right[['pair', 'surname']], on=['pair', 'surname'])
+    return pd.Series(pairs.index.isin(shared['pair']), index=pairs.index)
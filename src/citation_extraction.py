@@ -1,22 +1,27 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
 import pandas as pd
 import numpy as np
 from lxml import etree
 import regex
 import nltk
 import string
-import csv
 import re
 from nltk.sentiment.vader import SentimentIntensityAnalyzer
 import multiprocessing as mp
 
 import tei_tools
+import authors
+import features
+import storage
 
 data_dir = 'data/raw/'
 ns = {'tei': '{http://www.tei-c.org/ns/1.0}', 'w3': '{http://www.w3.org/XML/1998/namespace}'}
-sid = SentimentIntensityAnalyzer()
+# vader lexicon is loaded on first use, runs without sentiment features never load it
+sid = None
+
 
 # Keywords adapted versionof Tams, S., & Grover, V. (2010). The Effect of an IS Article's Structure on Its Impact. CAIS, 27, 10.
 introduction_keywords = ['introduction']
@@ -90,11 +95,7 @@ appendix_keywords = ['appendi',
                      'electronic companion']
 
 def parse_author(author_string):
-    authors = author_string.split(' and ')
-    last_names = []
-    for author in authors:
-        last_names.append(author[:author.index(',')])
-    return last_names
+    return authors.surnames(author_string)
 
 def build_citation_regex(authors, year):
     if len(authors) == 1:
@@ -108,6 +109,9 @@ def get_position_in_sentence(sentence):
     return sentence.index('REFERENCE')/(len(sentence)-len('REFERENCE'))
 
 def get_sentiment(document):
+    global sid
+    if sid is None:
+        sid = SentimentIntensityAnalyzer()
     return sid.polarity_scores(document)
 
 def is_textual_citation(sentence):
@@ -324,31 +328,63 @@ def get_heading_category(heading_title, position_in_document, full_headings, mat
             heading_catetory = 'introduction'
     return heading_catetory
 
-def parse_numeric_citation(row, CURRENT_LR, root):
-    df = pd.DataFrame(columns=columnnames)
+def get_sentiment_columns(prefix, sentiment):
+    return {prefix + '_' + score: sentiment[score] for score in ['neg', 'neu', 'pos', 'compound']}
+
+# computes the columns of each feature in features.registry from the citation and the values of the features it requires
+extractors = dict(
+    # alphanumeric citations cannot be textual
+    textual = lambda c, v: dict(textual=False if c['numeric'] else is_textual_citation(c['sentence'])),
+    separate = lambda c, v: dict(separate=is_separate(c['sentence'])),
+    popularity = lambda c, v: dict(sentence_popularity=get_popularity(c['sentence']), context_popularity=get_popularity(c['context'])),
+    density = lambda c, v: dict(sentence_density=get_density(c['sentence']), context_density=get_density(c['context'])),
+    position_in_sentence = lambda c, v: dict(position_in_sentence=get_position_in_sentence(c['sentence'])),
+    sentence_sentiment = lambda c, v: get_sentiment_columns('sentence', get_sentiment(c['sentence'])),
+    context_sentiment = lambda c, v: get_sentiment_columns('context', get_sentiment(c['context'])),
+    pos_structure = lambda c, v: dict(pos_pattern=get_pos_structure(c['sentence'])),
+    comp_sup = lambda c, v: dict(comp_sup=has_comp_sup(v['pos_pattern'])),
+    prp = lambda c, v: dict(prp=has_1st_3rd_prp(c['sentence'])),
+    pos_patterns = lambda c, v: dict(zip(['pos_0', 'pos_1', 'pos_2', 'pos_3', 'pos_4', 'pos_5'], find_pos_patterns(v['pos_pattern']))),
+    position_in_document = lambda c, v: dict(position_in_document=get_position_in_document(c['document'], c['predecessor'], c['sentence'], c['successor'])),
+    heading = lambda c, v: dict(heading_title=get_heading(c['paragraph'])),
+    heading_category = lambda c, v: dict(heading_category=get_heading_category(v['heading_title'], v['position_in_document'], c['full_headings'], c['matched_headings'])),
+    ref_in_figure_description = lambda c, v: dict(ref_in_figure_description=ref_in_figDesc(c['reference'], v['heading_title'])),
+    ref_in_table_description = lambda c, v: dict(ref_in_table_description=ref_in_tableDesc(c['reference'], v['heading_title'])),
+    ref_in_heading = lambda c, v: dict(ref_in_heading=ref_in_heading(c['reference'], v['heading_title']))
+)
+
+def compute_row(row, citation, selected_features):
+    values = dict(citation_key_lr=row['citation_key_lr'],
+                  citation_key_cp=row['citation_key_cp'],
+                  citation_sentence=citation['sentence'],
+                  predecessor=citation['predecessor'],
+                  successor=citation['successor'])
+    for name in selected_features:
+        values.update(extractors[name](citation, values))
+    return [values[column] for column in features.output_columns(selected_features)]
+
+def parse_numeric_citation(row, CURRENT_LR, root, selected_features):
+    rows = []
 
     whole_document_text = str(etree.tostring(root.find('.//' + ns['tei'] + 'body'), pretty_print=True).decode('utf-8'))
 
     full_headings = get_full_headings(root)
     matched_headings = match_headings(full_headings)
 
-    BIBLIOGRAPHY = pd.DataFrame(columns = ['reference_id', 'author', 'title', 'year', 'journal', 'similarity'])
+    entries = [pd.DataFrame(columns = ['reference_id', 'author', 'title', 'year', 'journal', 'similarity'])]
     for reference in root.find('.//' + ns['tei'] + 'listBibl'):
-        reference_id = tei_tools.get_reference_bibliography_id(reference)
-        title_string = tei_tools.get_reference_title_string(reference)
-        author_string = tei_tools.get_reference_author_string(reference)
-        year_string = tei_tools.get_reference_year_string(reference)
-        journal_string = tei_tools.get_reference_journal_string(reference)
+        record = tei_tools.read_bibl_struct(reference)
 
-        if title_string is None:
+        if record.title is None:
             continue
 
-        ENTRY = pd.DataFrame.from_records([[reference_id, author_string, title_string, year_string, journal_string, 0]],
+        ENTRY = pd.DataFrame.from_records([[record.id, record.authors, record.title, record.year, record.journal, 0]],
                                           columns = ['reference_id', 'author', 'title', 'year', 'journal', 'similarity'])
 
         ENTRY.loc[0, 'similarity'] = tei_tools.get_similarity(ENTRY, CURRENT_LR)
-        BIBLIOGRAPHY = BIBLIOGRAPHY.append(ENTRY)
+        entries.append(ENTRY)
 
+    BIBLIOGRAPHY = pd.concat(entries, sort=False)
     BIBLIOGRAPHY = BIBLIOGRAPHY.reset_index(drop=True)
 
     LR_ENTRY = BIBLIOGRAPHY.loc[BIBLIOGRAPHY['similarity'].idxmax()]
@@ -390,50 +426,18 @@ def parse_numeric_citation(row, CURRENT_LR, root):
                         predecessor = predecessor.strip()
                         successor = successor.strip()
 
-                        context = ' '.join([predecessor, sentence, successor])
-                        sentence_sent = get_sentiment(sentence)
-                        context_sent = get_sentiment(context)
-                        pos_structure = get_pos_structure(sentence)
-                        pos_patterns = find_pos_patterns(pos_structure)
-                        position_in_document = get_position_in_document(whole_document_text, predecessor, sentence, successor)
-                        heading_title = get_heading(p)
-
-                        df.loc[len(df)] = [row['citation_key_lr'],
-                               row['citation_key_cp'],
-                               sentence,
-                               predecessor,
-                               successor,
-                               False, # alphanumeric citations cannot be textual
-                               is_separate(sentence),
-                               get_popularity(sentence),
-                               get_popularity(context),
-                               get_density(sentence),
-                               get_density(context),
-                               get_position_in_sentence(sentence),
-                               sentence_sent['neg'],
-                               sentence_sent['neu'],
-                               sentence_sent['pos'],
-                               sentence_sent['compound'],
-                               context_sent['neg'],
-                               context_sent['neu'],
-                               context_sent['pos'],
-                               context_sent['compound'],
-                               has_comp_sup(pos_structure),
-                               has_1st_3rd_prp(sentence),
-                               pos_structure,
-                               pos_patterns[0],
-                               pos_patterns[1],
-                               pos_patterns[2],
-                               pos_patterns[3],
-                               pos_patterns[4],
-                               pos_patterns[5],
-                               position_in_document,
-                               heading_title,
-                               get_heading_category(heading_title, position_in_document, full_headings, matched_headings),
-                               ref_in_figDesc(ref, heading_title),
-                               ref_in_tableDesc(ref, heading_title),
-                               ref_in_heading(ref, heading_title)]
-    return(df)
+                        citation = dict(sentence=sentence,
+                                        predecessor=predecessor,
+                                        successor=successor,
+                                        context=' '.join([predecessor, sentence, successor]),
+                                        numeric=True,
+                                        document=whole_document_text,
+                                        paragraph=p,
+                                        reference=ref,
+                                        full_headings=full_headings,
+                                        matched_headings=matched_headings)
+                        rows.append(compute_row(row, citation, selected_features))
+    return pd.DataFrame(rows, columns=features.output_columns(selected_features))
 
 def extract_sentence_part_without_REF_or_CIT(sentence):
     #always choose the shorter part since the longer includes the other type of marker
@@ -455,8 +459,8 @@ def extract_sentence_part_without_REF_or_CIT(sentence):
     else:
         return right_part
 
-def parse_standard_citation(row, CURRENT_LR, root):
-    df = pd.DataFrame(columns=columnnames)
+def parse_standard_citation(row, CURRENT_LR, root, selected_features):
+    rows = []
     citation_regex = build_citation_regex(parse_author(row['author_lr']), row['year_lr'])
 
     whole_document_text = str(etree.tostring(root.find('.//' + ns['tei'] + 'body'), pretty_print=True).decode('utf-8'))
@@ -520,63 +524,34 @@ def parse_standard_citation(row, CURRENT_LR, root):
                         sentence = sentence.strip()
                         predecessor = predecessor.strip()
                         successor = successor.strip()
-                        context = ' '.join([predecessor, sentence, successor])
-                        sentence_sent = get_sentiment(sentence)
-                        context_sent = get_sentiment(context)
-                        pos_structure = get_pos_structure(sentence)
-                        pos_patterns = find_pos_patterns(pos_structure)
-                        position_in_document = get_position_in_document(whole_document_text, predecessor, sentence, successor)
-                        heading_title = get_heading(p)
-
-                        df.loc[len(df)] = [row['citation_key_lr'],
-                                           row['citation_key_cp'],
-                                           sentence,
-                                           predecessor,
-                                           successor,
-                                           is_textual_citation(sentence),
-                                           is_separate(sentence),
-                                           get_popularity(sentence),
-                                           get_popularity(context),
-                                           get_density(sentence),
-                                           get_density(context),
-                                           get_position_in_sentence(sentence),
-                                           sentence_sent['neg'],
-                                           sentence_sent['neu'],
-                                           sentence_sent['pos'],
-                                           sentence_sent['compound'],
-                                           context_sent['neg'],
-                                           context_sent['neu'],
-                                           context_sent['pos'],
-                                           context_sent['compound'],
-                                           has_comp_sup(pos_structure),
-                                           has_1st_3rd_prp(sentence),
-                                           pos_structure,
-                                           pos_patterns[0],
-                                           pos_patterns[1],
-                                           pos_patterns[2],
-                                           pos_patterns[3],
-                                           pos_patterns[4],
-                                           pos_patterns[5],
-                                           position_in_document,
-                                           heading_title,
-                                           get_heading_category(heading_title, position_in_document, full_headings, matched_headings),
-                                           ref_in_figDesc(ref, heading_title),
-                                           ref_in_tableDesc(ref, heading_title),
-                                           ref_in_heading(ref, heading_title)]
-    return(df)
-
-
-
-def parse_citation(row):
+                        citation = dict(sentence=sentence,
+                                        predecessor=predecessor,
+                                        successor=successor,
+                                        context=' '.join([predecessor, sentence, successor]),
+                                        numeric=False,
+                                        document=whole_document_text,
+                                        paragraph=p,
+                                        reference=ref,
+                                        full_headings=full_headings,
+                                        matched_headings=matched_headings)
+                        rows.append(compute_row(row, citation, selected_features))
+    return pd.DataFrame(rows, columns=features.output_columns(selected_features))
+
+
+
+def parse_citation(row, selected_features=None, path=None):
+    # the selection is an argument rather than a module global, pool workers only inherit globals when forked
+    selected_features = features.select_features() if selected_features is None else selected_features
+    columnnames = features.output_columns(selected_features)
     CURRENT_LR = ARTICLE[ARTICLE.citation_key == row['citation_key_lr']].head(1)
     CURRENT_LR = CURRENT_LR[['citation_key', 'author', 'title', 'year', 'journal']]
     CURRENT_LR.rename(index=str, columns={"citation_key": "reference_id"}, inplace=True)
     CURRENT_LR['similarity'] = 0
 
     # before parsing in-text citations: add ref-tags for LRs that have not been annotated by grobid
-    file = open(data_dir + 'xml/' + row['citation_key_cp'] + '.tei.xml', "r")
+    file = open(path or data_dir + 'xml/' + row['citation_key_cp'] + '.tei.xml', "r")
     xml_string = file.read()
-    root = etree.fromstring(xml_string)
+    root = tei_tools.fromstring(xml_string)
     reference_id = tei_tools.get_reference_id(root, CURRENT_LR)
     author_list = parse_author(CURRENT_LR.iloc[0]['author'])
     if len(author_list) > 1:
@@ -599,20 +574,15 @@ def parse_citation(row):
     #    outfile.write(xml_string)
     #    outfile.close()
 
-    root = etree.fromstring(str.encode(xml_string))
+    root = tei_tools.fromstring(str.encode(xml_string))
 
     if tei_tools.paper_alphanumeric_citation_style(root):
-        result = parse_numeric_citation(row, CURRENT_LR, root)
+        result = parse_numeric_citation(row, CURRENT_LR, root, selected_features)
     else:
-        result = parse_standard_citation(row, CURRENT_LR, root)
+        result = parse_standard_citation(row, CURRENT_LR, root, selected_features)
 
     if result.empty:
-        emptyvalues = [row['citation_key_lr'],
-                       row['citation_key_cp'],
-                       '', '', '', '', '', '', '', '', '', '',
-                       '', '', '', '', '', '', '', '', '', '',
-                       '', '', '', '', '', '', '', '', '', '',
-                       '', '', '']
+        emptyvalues = [row['citation_key_lr'], row['citation_key_cp']] + [''] * (len(columnnames) - 2)
         df = pd.DataFrame(columns=columnnames)
         df.loc[0] = emptyvalues
         return(df)
@@ -624,6 +594,15 @@ def collect_result(result):
     CITATION = pd.concat([CITATION, result])
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Extract citation sentences from raw data (tei-xml of the pdfs)')
+    parser.add_argument('--tier', choices=sorted(features.tiers), default='full', help='compute only the features of this cost tier')
+    parser.add_argument('--columns', nargs='+', help='compute only the features producing these columns')
+    args = parser.parse_args()
+    try:
+        selected_features = features.select_features(args.columns, args.tier)
+    except ValueError as e:
+        parser.error(str(e))
+
     ARTICLE = pd.read_csv(data_dir + 'ARTICLE.csv')
     LR_CP = pd.read_csv(data_dir + 'LR_CP.csv')
     LR_CP = pd.merge(LR_CP, ARTICLE, left_on='citation_key_lr', right_on='citation_key')
@@ -632,49 +611,15 @@ if __name__ == "__main__":
     LR_CP = pd.merge(LR_CP, ARTICLE, left_on='citation_key_cp', right_on='citation_key')
     LR_CP = LR_CP[['citation_key_lr', 'citation_key_cp', 'title_lr', 'author_lr', 'year_lr', 'journal']]
     LR_CP.columns = ['citation_key_lr', 'citation_key_cp', 'title_lr', 'author_lr', 'year_lr', 'journal_cp']
-    columnnames = ['citation_key_lr',
-                   'citation_key_cp',
-                   'citation_sentence',
-                   'predecessor',
-                   'successor',
-                   'textual',
-                   'separate',
-                   'sentence_popularity',
-                   'context_popularity',
-                   'sentence_density',
-                   'context_density',
-                   'position_in_sentence',
-                   'sentence_neg',
-                   'sentence_neu',
-                   'sentence_pos',
-                   'sentence_compound',
-                   'context_neg',
-                   'context_neu',
-                   'context_pos',
-                   'context_compound',
-                   'comp_sup',
-                   'prp',
-                   'pos_pattern',
-                   'pos_0',
-                   'pos_1',
-                   'pos_2',
-                   'pos_3',
-                   'pos_4',
-                   'pos_5',
-                   'position_in_document',
-                   'heading_title',
-                   'heading_category',
-                   'ref_in_figure_description',
-                   'ref_in_table_description',
-                   'ref_in_heading']
-    CITATION = pd.DataFrame(columns=columnnames)
+    CITATION = pd.DataFrame(columns=features.output_columns(selected_features))
 
     pool = mp.Pool(mp.cpu_count()-2)
     for i, row in LR_CP.iterrows():
-        pool.apply_async(parse_citation, args=(row, ), callback=collect_result)
+        pool.apply_async(parse_citation, args=(row, selected_features), callback=collect_result)
     pool.close()
     pool.join()
     
     CITATION = CITATION.drop_duplicates()
     CITATION = CITATION.sort_values(['citation_key_lr', 'citation_key_cp'])
-    CITATION.to_csv('data/interim/CITATION.csv', index=False, quoting=csv.QUOTE_ALL)
+    storage.write_table(CITATION, 'CITATION')
+    storage.export_csv(CITATION, 'data/interim/CITATION.csv')
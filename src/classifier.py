@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.metrics import f1_score, precision_score, recall_score, roc_auc_score
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+from sklearn.pipeline import make_pipeline
+import artifacts
+import storage
+from config import classifier_params
+
+models = {}
+
+def load_matrix(path=None):
+    return artifacts.load_matrix(path or storage.paths['FEATURE_MATRIX'])
+
+def make_model(params, n_jobs=1):
+    # similarity and topic features can be missing, the forest needs complete rows
+    return make_pipeline(SimpleImputer(strategy='median'),
+                         RandomForestClassifier(n_jobs=n_jobs,
+                                                random_state=classifier_params['seed'],
+                                                class_weight=classifier_params['class_weight'],
+                                                **params))
+
+def get_candidates():
+    return list(ParameterGrid({key: list(values) for key, values in classifier_params['candidates'].items()}))
+
+def hash_feature_set(features, labels, metadata):
+    # fitted models are reused as long as the matrix, its columns and the search settings are unchanged
+    settings = {key: classifier_params[key] for key in ['folds', 'seed', 'class_weight', 'candidates']}
+    digest = hashlib.sha1()
+    digest.update(json.dumps([column['name'] for column in metadata['columns']]).encode('utf-8'))
+    digest.update(np.ascontiguousarray(features).data)
+    digest.update(np.ascontiguousarray(labels).data)
+    digest.update(repr(sorted(settings.items())).encode('utf-8'))
+    return digest.hexdigest()
+
+def get_folds(labels):
+    # every fold needs both classes
+    num_folds = min(classifier_params['folds'], np.bincount(labels, minlength=2).min())
+    if num_folds < 2:
+        raise ValueError('cross-validation needs at least two examples of each class')
+    return list(StratifiedKFold(n_splits=num_folds, shuffle=True, random_state=classifier_params['seed']).split(np.zeros(len(labels)), labels))
+
+def score(labels, probability):
+    predicted = probability >= classifier_params['threshold']
+    return dict(f1=f1_score(labels, predicted),
+                precision=precision_score(labels, predicted),
+                recall=recall_score(labels, predicted),
+                roc_auc=roc_auc_score(labels, probability))
+
+def fit_fold(params, fold, features, labels, train, test):
+    t0 = time.time()
+    model = make_model(params).fit(features[train], labels[train])
+    t1 = time.time()
+    probability = model.predict_proba(features[test])[:, 1]
+    t2 = time.time()
+    result = dict(candidate=json.dumps(params, sort_keys=True), fold=fold, fit_seconds=t1 - t0, predict_seconds=t2 - t1)
+    result.update(score(labels[test], probability))
+    return result
+
+def cross_validate(features, labels, candidates=None, workers=None):
+    # one task per candidate and fold, the memory-mapped matrix is shared with the workers instead of copied
+    candidates = candidates or get_candidates()
+    workers = workers or classifier_params['workers']
+    folds = get_folds(labels)
+    tasks = [(params, fold) for params in candidates for fold in range(len(folds))]
+    logging.info('cross-validation: %i candidates x %i folds on %i workers', len(candidates), len(folds), min(workers, len(tasks)))
+    results = joblib.Parallel(n_jobs=min(workers, len(tasks)))(
+        joblib.delayed(fit_fold)(params, fold, features, labels, *folds[fold]) for params, fold in tasks)
+    return pd.DataFrame(results, columns=['candidate', 'fold', 'f1', 'precision', 'recall', 'roc_auc', 'fit_seconds', 'predict_seconds'])
+
+def summarize_results(RESULTS):
+    SUMMARY = RESULTS.drop(columns=['fold']).groupby('candidate').agg(['mean', 'std'])
+    SUMMARY.columns = [' '.join(col).strip() for col in SUMMARY.columns.values]
+    return SUMMARY.sort_values('f1 mean', ascending=False).reset_index()
+
+def model_file(feature_hash):
+    return classifier_params['model_dir'] + 'classifier_' + feature_hash[:16] + '.pkl'
+
+def train(refit=False, path=None):
+    keys, features, labels, metadata = load_matrix(path)
+    labels = np.asarray(labels).astype(np.int64)
+    feature_hash = hash_feature_set(features, labels, metadata)
+    if not os.path.exists(classifier_params['model_dir']):
+        os.makedirs(classifier_params['model_dir'])
+    if os.path.exists(model_file(feature_hash)) and not refit:
+        logging.info('classifier: feature set %s unchanged, using %s', feature_hash[:16], model_file(feature_hash))
+    else:
+        RESULTS = cross_validate(features, labels)
+        SUMMARY = summarize_results(RESULTS)
+        RESULTS.to_csv(classifier_params['model_dir'] + 'cv_folds.csv', index=False)
+        SUMMARY.to_csv(classifier_params['model_dir'] + 'cv_summary.csv', index=False)
+        best = SUMMARY.iloc[0]
+        params = json.loads(best['candidate'])
+        logging.info('best candidate: %s (f1 %.3f, roc auc %.3f)', best['candidate'], best['f1 mean'], best['roc_auc mean'])
+
+        t0 = time.time()
+        model = make_model(params, n_jobs=classifier_params['workers']).fit(features, labels)
+        fit_seconds = time.time() - t0
+        logging.info('fit: %i rows in %.3fs (%.0f rows/s)', len(labels), fit_seconds, len(labels) / max(fit_seconds, 1e-9))
+        joblib.dump(dict(model=model,
+                         columns=[column['name'] for column in metadata['columns']],
+                         params=params,
+                         feature_hash=feature_hash,
+                         metrics={column: float(best[column]) for column in SUMMARY.columns if column != 'candidate'}),
+                    model_file(feature_hash))
+    with open(classifier_params['model_dir'] + 'classifier.info', 'w') as info_file:
+        json.dump(dict(model_file=model_file(feature_hash), feature_hash=feature_hash), info_file, indent=2)
+    return load_model(model_file(feature_hash))
+
+def has_model():
+    return os.path.exists(classifier_params['model_dir'] + 'classifier.info')
+
+def load_model(path=None):
+    if path is None:
+        with open(classifier_params['model_dir'] + 'classifier.info', 'r') as info_file:
+            path = json.load(info_file)['model_file']
+    if path not in models:
+        models[path] = joblib.load(path)
+    return models[path]
+
+def predict(df, model=None):
+    # batch scoring of feature frame rows, features are aligned to the columns the model was trained on
+    model = model or load_model()
+    batch_size = classifier_params['batch_size']
+    probability = np.empty(len(df), dtype=np.float32)
+    t0 = time.time()
+    for start in range(0, len(df), batch_size):
+        features = storage.feature_matrix(df.iloc[start:start + batch_size], model['columns'])
+        probability[start:start + batch_size] = model['model'].predict_proba(features)[:, 1]
+    predict_seconds = time.time() - t0
+    logging.info('predict: %i rows in %.3fs (%.0f rows/s)', len(df), predict_seconds, len(df) / max(predict_seconds, 1e-9))
+    PREDICTIONS = pd.DataFrame({key: df[key].values for key in storage.keys if key in df})
+    PREDICTIONS['USE_probability'] = probability
+    PREDICTIONS['USE_predicted'] = probability >= classifier_params['threshold']
+    return PREDICTIONS
+
+def read_pairs(path):
+    if path.endswith('.parquet'):
+        return storage.read_table('FEATURE_FRAME', path=path)
+    return pd.read_csv(path)
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Train the machine learning classifier on the feature frame and score new pairs')
+    parser.add_argument('--refit', action='store_true', help='cross-validate and fit again even if a model of the same feature set exists')
+    parser.add_argument('--predict', metavar='PATH', help='score the pairs of a feature frame csv or parquet file with the trained model')
+    parser.add_argument('--output', metavar='PATH', help='csv file for the predictions, printed to stdout if omitted')
+    args = parser.parse_args()
+
+    if args.predict:
+        PREDICTIONS = predict(read_pairs(args.predict))
+        if args.output:
+            PREDICTIONS.to_csv(args.output, index=False)
+        else:
+            print(PREDICTIONS.to_csv(index=False))
+    else:
+        train(args.refit)
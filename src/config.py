@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import multiprocessing as mp
+import os
+
+lda_params = dict(
+    model_dir = 'models/lda/',
+    num_topics = 50,
+    num_passes = 50,
+    markers = True,
+    tokenize = True,
+    punctuation = True,
+    numbers = True,
+    common_stopwords = True,
+    custom_stopwords = True,
+    bigrams = True,
+    trigrams = True,
+    lemmatize = True,
+    pos_tags = ('NN', 'VB'),
+    no_below = 1,
+    no_above = 1.0,
+    keep_n = None,
+    hashing = False,
+    id_range = 2 ** 18,
+    early_stopping = False,
+    min_passes = 5,
+    min_improvement = 0.001,
+    min_drift = 0.001,
+    holdout_every = 10,
+    max_oov_rate = 0.05,
+    max_perplexity_ratio = 1.2,
+    streaming = False,
+    stream_batch_size = 1000
+)
+
+lsa_params = dict(
+    model_dir = 'models/lsa/',
+    num_topics = 300,
+    randomized = False,
+    rank = 100,
+    power_iters = 2,
+    extra_samples = 100,
+    workers = max(mp.cpu_count() - 2, 1),
+    no_below = 1,
+    no_above = 1.0,
+    keep_n = None,
+    hashing = False,
+    id_range = 2 ** 16
+)
+
+index_params = dict(
+    method = 'auto',
+    max_exact_size = 100000,
+    k = 10,
+    num_tables = 16,
+    num_bits = 10,
+    seed = 0,
+    benchmark_queries = 200
+)
+
+sweep_params = dict(
+    sweep_dir = 'models/lda/sweep/',
+    num_topics = (10, 20, 30, 40, 50, 75, 100),
+    num_passes = (10, 25, 50),
+    iterations = 500,
+    cores = max(mp.cpu_count() - 2, 1),
+    coherence = 'u_mass',
+    holdout_every = 10
+)
+
+# parameters that change the output of the LDA preprocessing pipeline
+lda_pipeline = ('markers',
+                'tokenize',
+                'punctuation',
+                'numbers',
+                'common_stopwords',
+                'custom_stopwords',
+                'bigrams',
+                'trigrams',
+                'lemmatize',
+                'pos_tags')
+
+classifier_params = dict(
+    model_dir = 'models/classifier/',
+    folds = 5,
+    seed = 0,
+    workers = max(mp.cpu_count() - 2, 1),
+    class_weight = 'balanced',
+    threshold = 0.5,
+    batch_size = 10000,
+    # random forest hyperparameters, every combination is cross-validated
+    candidates = dict(
+        n_estimators = (100, 300),
+        max_depth = (None, 10),
+        min_samples_leaf = (1, 5)
+    )
+)
+
+service_params = dict(
+    host = '127.0.0.1',
+    port = 8080,
+    # requests can only name tei files below this directory
+    tei_dir = 'data/raw/xml/'
+)
+
+storage_params = dict(
+    partition = False,
+    # rows per parquet row group, the unit streaming readers load at once
+    row_group_size = 10000
+)
+
+custom_stopwords_file = 'data/raw/custom_stopwords.txt'
+
+cache_params = dict(
+    cache_file = 'data/cache/tokens.db',
+    max_size = 512 * 1024 * 1024
+)
+
+def hash_file(path):
+    if not os.path.exists(path):
+        return ''
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def lda_pipeline_config():
+    config = {key: lda_params[key] for key in lda_pipeline}
+    config['pipeline'] = 'lda'
+    # edits to the stopword list change the tokens without touching any parameter
+    if lda_params['custom_stopwords']:
+        config['custom_stopwords_hash'] = hash_file(custom_stopwords_file)
+    return config
+
+def lsa_pipeline_config():
+    return dict(pipeline = 'lsa')
@@ -4,24 +4,16 @@
 import pandas as pd
 from lxml import etree
 import re
+import multiprocessing as mp
 
 import tei_tools
 
 data_dir = 'data/raw/'
 ns = {'tei': '{http://www.tei-c.org/ns/1.0}', 'w3': '{http://www.w3.org/XML/1998/namespace}'}
 
-def extract_total_references(root):
-    references = root.findall('.//' + ns['tei'] + 'div[@type="references"]/' + ns['tei'] + 'listBibl/' + ns['tei'] + 'biblStruct')
-    return len(references)
-
-def extract_total_citations(root):
-    citations = root.findall('.//' + ns['tei'] + 'ref[@type="bibr"]')
-    return len(citations)
-
-def get_abstract_replacement(root):
+def get_abstract_replacement(div):
     replacement = ''
     try:
-        div = root.find('.//' + ns['tei'] + 'body').find('.//' + ns['tei'] + 'div')
         replacement = str(etree.tostring(div, pretty_print=True).decode('utf-8'))
         clean = re.compile('<.*?>')
         replacement = re.sub(clean, '', replacement)
@@ -30,23 +22,58 @@ def get_abstract_replacement(root):
     replacement = replacement.replace('\n','').replace('\r','').lstrip().rstrip()
     return replacement
 
+def extract_statistics(path):
+    # one streaming pass over the tei file, elements are cleared once they are no longer needed
+    total_references = 0
+    total_citations = 0
+    abstract = None
+    replacement_div = None
+    seen_abstract = seen_body = False
+    kept = set()
+    for event, elem in tei_tools.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            # the first abstract and the first div of the first body are kept whole until processed
+            if elem.tag == ns['tei'] + 'abstract' and not seen_abstract:
+                seen_abstract = True
+                kept.add(elem)
+            elif elem.tag == ns['tei'] + 'body' and not seen_body:
+                seen_body = True
+                body = elem
+            elif elem.tag == ns['tei'] + 'div' and seen_body and replacement_div is None and body in elem.iterancestors():
+                replacement_div = elem
+                kept.add(elem)
+            continue
+
+        if elem.tag == ns['tei'] + 'biblStruct':
+            parent = elem.getparent()
+            grandparent = parent.getparent() if parent is not None else None
+            if parent.tag == ns['tei'] + 'listBibl' and grandparent is not None and grandparent.tag == ns['tei'] + 'div' and grandparent.get('type') == 'references':
+                total_references += 1
+        elif elem.tag == ns['tei'] + 'ref' and elem.get('type') == 'bibr':
+            total_citations += 1
+        elif elem.tag == ns['tei'] + 'abstract' and elem in kept:
+            abstract = tei_tools.abstract_text(elem)
+
+        if elem in kept:
+            kept.discard(elem)
+        elif not kept and elem is not replacement_div:
+            elem.clear()
+            while elem.getprevious() is not None and elem.getprevious() is not replacement_div:
+                del elem.getparent()[0]
+    if abstract is None:
+        abstract = get_abstract_replacement(replacement_div) if replacement_div is not None else ''
+    return total_references, total_citations, abstract
+
 def extract_cp_data():
     ARTICLE = pd.read_csv(data_dir + 'ARTICLE.csv')
     LR_CP = pd.read_csv(data_dir + 'LR_CP.csv')
     LR_CP = LR_CP[['citation_key_cp']].drop_duplicates()
     LR_CP = pd.merge(LR_CP, ARTICLE, left_on='citation_key_cp', right_on='citation_key')
-    LR_CP['total_references'] = 0
-    LR_CP['total_citations'] = 0
-    LR_CP['abstract'] = ''
-    for index, row in LR_CP.iterrows():
-        root = etree.parse(data_dir + 'xml/' + row['citation_key_cp'] + '.tei.xml').getroot()
-        
-        LR_CP.loc[index, 'total_references'] = extract_total_references(root)
-        LR_CP.loc[index, 'total_citations'] = extract_total_citations(root)
-        LR_CP.loc[index, 'abstract'] = (tei_tools.extract_abstract(root) 
-                                        if (tei_tools.extract_abstract(root) is not None) 
-                                        else get_abstract_replacement(root))
-        
+    pool = mp.Pool(max(mp.cpu_count() - 2, 1))
+    statistics = pool.map(extract_statistics, [data_dir + 'xml/' + citation_key + '.tei.xml' for citation_key in LR_CP['citation_key_cp']])
+    pool.close()
+    pool.join()
+    LR_CP['total_references'], LR_CP['total_citations'], LR_CP['abstract'] = zip(*statistics)
     LR_CP = LR_CP[['citation_key_cp', 'title', 'total_references', 'total_citations', 'abstract']]
     LR_CP.to_csv('data/interim/CP.csv', index=False)
 
@@ -3,24 +3,34 @@
 
 import pandas as pd
 import numpy as np
-import math
-import csv
+import argparse
+import collections
+import logging
+import os
+import resource
 from gensim.models.ldamodel import LdaModel
 from gensim.corpora import Dictionary
-from config import lda_params
+from gensim import matutils
+from scipy import sparse
+from scipy.special import psi
+from config import lda_params, lda_pipeline_config, hash_file
 import preprocessing
+import artifacts
+import token_cache
+import storage
+
+topic_models = {}
 
 def prepare_dataframe(df, context=True):
     df.dropna(subset=['citation_sentence'], inplace=True)
-    df.fillna('', inplace=True)
     df.reset_index(drop=True, inplace=True)
     if context:
-        df['predecessor'] = df['predecessor'].astype(str)
-        df['successor'] = df['successor'].astype(str)
+        df['predecessor'] = df['predecessor'].fillna('').astype(str)
+        df['successor'] = df['successor'].fillna('').astype(str)
         df['context'] = df['predecessor'] + ' ' + df['citation_sentence'] + ' ' + df['successor']
     else:
         df['context'] = df['citation_sentence']
-    df = df.groupby(['citation_key_lr', 'citation_key_cp'])['context'].apply(lambda x: ' '.join(x)).reset_index()
+    df = df.groupby(['citation_key_lr', 'citation_key_cp'], observed=True)['context'].apply(lambda x: ' '.join(x)).reset_index()
     return df
 
 def preprocess_doc(row, context=True):
@@ -62,13 +72,140 @@ def preprocess_doc(row, context=True):
     citation_sentence = preprocessing.clean_doc(citation_sentence)
     return citation_sentence
 
+def preprocess_documents(df):
+    documents = df['context'].astype(str).tolist()
+    return token_cache.get_tokens(documents, lambda docs: [preprocess_doc({'context': doc}) for doc in docs], lda_pipeline_config())
+
+def dirichlet_expectation(alpha):
+    return psi(alpha) - psi(alpha.sum(axis=1))[:, np.newaxis]
+
+def infer_topics(matrix, lda, iterations=50, threshold=0.001, chunksize=2000):
+    # variational E-step of the LDA model for all rows of a sparse document-term matrix at once
+    expElogbeta = np.asarray(lda.expElogbeta)
+    alpha = np.asarray(lda.alpha)
+    topics = np.zeros((matrix.shape[0], lda.num_topics))
+    for start in range(0, matrix.shape[0], chunksize):
+        chunk = matrix[start:start + chunksize].tocoo()
+        # fixed initialization and per-document convergence, so a document's topics do not depend on the other rows
+        gamma = np.ones((chunk.shape[0], lda.num_topics))
+        expElogtheta = np.exp(dirichlet_expectation(gamma))
+        active = np.ones(chunk.shape[0], dtype=bool)
+        for _ in range(iterations):
+            last_gamma = gamma
+            # phinorm for every non-zero (document, term) cell only
+            phinorm = np.einsum('nk,kn->n', expElogtheta[chunk.row], expElogbeta[:, chunk.col]) + 1e-100
+            ratio = sparse.csr_matrix((chunk.data / phinorm, (chunk.row, chunk.col)), shape=chunk.shape)
+            gamma = np.where(active[:, np.newaxis], alpha + expElogtheta * ratio.dot(expElogbeta.T), last_gamma)
+            expElogtheta = np.exp(dirichlet_expectation(gamma))
+            active &= np.mean(np.abs(gamma - last_gamma), axis=1) >= threshold
+            if not active.any():
+                break
+        topics[start:start + chunk.shape[0]] = gamma / gamma.sum(axis=1)[:, np.newaxis]
+    return topics
+
+def load_topic_model():
+    # kept for the lifetime of the process, long-running scorers load the model once
+    if lda_params['model_dir'] not in topic_models:
+        topic_models[lda_params['model_dir']] = (artifacts.load_model(LdaModel, lda_params['model_dir'] + 'lda.model'),
+                                                 Dictionary.load(lda_params['model_dir'] + 'lda.dict'))
+    return topic_models[lda_params['model_dir']]
+
+def get_topic_features(df):
+    lda, dictionary = load_topic_model()
+    corpus = [dictionary.doc2bow(doc) for doc in preprocess_documents(df)]
+    matrix = matutils.corpus2csc(corpus, num_terms=lda.num_terms, num_docs=len(corpus)).T.tocsr()
+    topics = pd.DataFrame(infer_topics(matrix, lda), columns=['topic_{}'.format(k) for k in range(lda.num_topics)])
+    topics['citation_key_lr'] = df['citation_key_lr'].values
+    topics['citation_key_cp'] = df['citation_key_cp'].values
+    return topics
+
+def build_key_index(*frames):
+    # citation keys shared by all frames of the build, each key is stored once
+    return {key: pd.Index(sorted(set().union(*[df[key].astype(str).unique() for df in frames if key in df]))) for key in storage.keys}
+
+def intern_keys(df, key_index):
+    df = df.copy()
+    for key in storage.keys:
+        if key in df:
+            df[key] = key_index[key].get_indexer(df[key].astype(str)).astype(np.int32)
+    return df
+
+def restore_keys(df, key_index):
+    for key in storage.keys:
+        df[key] = pd.Categorical.from_codes(df[key].values, categories=key_index[key])
+    return df
+
+# binned by percent into the mention positions, float32 rounding would move mentions to the next bin
+exact_columns = ['position_in_document']
+
+def compact(df):
+    for column in df.columns:
+        if column in exact_columns:
+            continue
+        if df[column].dtype == np.float64:
+            df[column] = df[column].astype(np.float32)
+        elif df[column].dtype == np.int64:
+            df[column] = df[column].astype(np.int32)
+    return df
+
+def report_memory(df):
+    payload = df.memory_usage(deep=True).sum() / 1024 ** 2
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    logging.info('feature frame: %i rows, %i columns, %.1f MB payload, %.1f MB peak memory', len(df), len(df.columns), payload, peak)
+
+# CITATION columns used by the feature frame
+citation_columns = ['citation_key_lr', 'citation_key_cp', 'citation_sentence', 'predecessor', 'successor',
+                    'textual', 'separate', 'comp_sup', 'prp', 'pos_0', 'pos_1', 'pos_2', 'pos_3', 'pos_4', 'pos_5',
+                    'sentence_popularity', 'context_popularity', 'sentence_density', 'context_density', 'position_in_sentence',
+                    'sentence_neg', 'sentence_neu', 'sentence_pos', 'sentence_compound',
+                    'context_neg', 'context_neu', 'context_pos', 'context_compound',
+                    'position_in_document', 'heading_category',
+                    'ref_in_figure_description', 'ref_in_table_description', 'ref_in_heading']
+
+mention_position_columns = ['mention_positions_' + str(position) for position in range(10, 101, 10)]
+
+heading_category_columns = collections.OrderedDict([('-', 'heading_category_NA'),
+                                                    ('introduction', 'heading_category_intro'),
+                                                    ('background', 'heading_category_background'),
+                                                    ('theory_frontend', 'heading_category_theory'),
+                                                    ('method', 'heading_category_methods'),
+                                                    ('results', 'heading_category_results'),
+                                                    ('implications', 'heading_category_implications'),
+                                                    ('appendix', 'heading_category_appendix')])
+
+def one_hot(keys, values, columns):
+    dummies = pd.get_dummies(pd.Categorical(values, categories=columns)).astype(np.int64)
+    dummies.index = keys.index
+    return pd.concat([keys, dummies], axis=1)
+
+def get_mention_heading_counts(df):
+    keys = ['citation_key_lr', 'citation_key_cp']
+    counts = [df[keys].drop_duplicates()]
+    if 'position_in_document' in df:
+        positions = df[keys + ['position_in_document']].drop_duplicates()
+        # mention position in the first x % of the paper, unparseable positions fall into no bin
+        mention_position = np.ceil(pd.to_numeric(positions['position_in_document'], errors='coerce') * 100)
+        mention_bins = pd.cut(mention_position, bins=range(0, 101, 10), labels=mention_position_columns)
+        counts.append(one_hot(positions[keys], mention_bins, mention_position_columns))
+    if 'heading_category' in df:
+        headings = df[keys + ['heading_category']].drop_duplicates()
+        heading_bins = headings['heading_category'].map(heading_category_columns)
+        counts.append(one_hot(headings[keys], heading_bins, list(heading_category_columns.values())))
+
+    counts = pd.concat(counts, sort=False)
+    counts = counts.fillna(0).groupby(keys, observed=True).sum().astype(np.int64)
+    return counts.reset_index()
+
+def available(df, columns):
+    return [column for column in columns if column in df]
+
 def summarize_citation_df(df):
     df = df[df['citation_sentence'].notnull()]
     df_keys = df.loc[:,['citation_key_lr', 'citation_key_cp']]
     df_keys['focal_citations'] = 0
-    df_keys = df_keys.groupby(['citation_key_lr', 'citation_key_cp']).agg({'focal_citations': 'count'}).reset_index()
+    df_keys = df_keys.groupby(['citation_key_lr', 'citation_key_cp'], observed=True).agg({'focal_citations': 'count'}).reset_index()
 
-    df_bool = df.loc[:,['citation_key_lr', 
+    df_bool = df.loc[:,available(df, ['citation_key_lr', 
                         'citation_key_cp', 
                         'textual',
                         'separate', 
@@ -82,232 +219,257 @@ def summarize_citation_df(df):
                         'pos_5', 
                         'ref_in_figure_description', 
                         'ref_in_table_description', 
-                        'ref_in_heading']]
-    df_bool = df_bool.groupby(['citation_key_lr', 'citation_key_cp']).aggregate(np.sum)
+                        'ref_in_heading'])]
+    df_bool = df_bool.groupby(['citation_key_lr', 'citation_key_cp'], observed=True).aggregate(np.sum)
     df_bool = df_bool.reset_index()
     
-    df_else = df[['citation_key_lr', 'citation_key_cp', 'sentence_popularity','context_popularity', 'sentence_density', 'context_density','position_in_sentence', 'sentence_neg', 'sentence_neu', 'sentence_pos','sentence_compound', 'context_neg', 'context_neu', 'context_pos','context_compound']]
-    df_else = df_else.groupby(['citation_key_lr', 'citation_key_cp']).agg([np.min, np.max, np.mean])
+    df_else = df[available(df, ['citation_key_lr', 'citation_key_cp', 'sentence_popularity','context_popularity', 'sentence_density', 'context_density','position_in_sentence', 'sentence_neg', 'sentence_neu', 'sentence_pos','sentence_compound', 'context_neg', 'context_neu', 'context_pos','context_compound'])]
+    df_else = df_else.groupby(['citation_key_lr', 'citation_key_cp'], observed=True).agg([np.min, np.max, np.mean])
     df_else = df_else.reset_index()
     df_else.columns = [' '.join(col).strip() for col in df_else.columns.values]
 
-    df_mention_position = df[['citation_key_lr', 'citation_key_cp', 'position_in_document']].drop_duplicates().reset_index()
-    df_mention_position['mention_positions_10'] = 0
-    df_mention_position['mention_positions_20'] = 0
-    df_mention_position['mention_positions_30'] = 0
-    df_mention_position['mention_positions_40'] = 0
-    df_mention_position['mention_positions_50'] = 0
-    df_mention_position['mention_positions_60'] = 0
-    df_mention_position['mention_positions_70'] = 0
-    df_mention_position['mention_positions_80'] = 0
-    df_mention_position['mention_positions_90'] = 0
-    df_mention_position['mention_positions_100'] = 0
-
-    for i,row in df_mention_position.iterrows():
-        # test for NaN
-        if row['position_in_document'] == '':
-            continue
-        mention_position = math.ceil(float(row['position_in_document'])*100) # mention position in the first x % of the paper
-        if 0 < mention_position <= 10:
-            df_mention_position.at[i, 'mention_positions_10'] +=1
-        if 10 < mention_position <= 20:
-            df_mention_position.at[i, 'mention_positions_20'] +=1
-        if 20 < mention_position <= 30:
-            df_mention_position.at[i, 'mention_positions_30'] +=1
-        if 30 < mention_position <= 40:
-            df_mention_position.at[i, 'mention_positions_40'] +=1
-        if 40 < mention_position <= 50:
-            df_mention_position.at[i, 'mention_positions_50'] +=1
-        if 50 < mention_position <= 60:
-            df_mention_position.at[i, 'mention_positions_60'] +=1
-        if 60 < mention_position <= 70:
-            df_mention_position.at[i, 'mention_positions_70'] +=1
-        if 70 < mention_position <= 80:
-            df_mention_position.at[i, 'mention_positions_80'] +=1
-        if 80 < mention_position <= 90:
-            df_mention_position.at[i, 'mention_positions_90'] +=1
-        if 90 < mention_position <= 100:
-            df_mention_position.at[i, 'mention_positions_100'] +=1
-
-    df_mention_position = df_mention_position.groupby(['citation_key_lr', 'citation_key_cp']).agg([np.sum])
-    df_mention_position = df_mention_position.reset_index()
-    df_mention_position.columns = [' '.join(col).strip() for col in df_mention_position.columns.values]
-    df_mention_position.drop(columns = ['index sum'], inplace=True)
-    df_mention_position.rename(columns={'mention_positions_10 sum': 'mention_positions_10',
-                                          'mention_positions_20 sum': 'mention_positions_20',
-                                          'mention_positions_30 sum': 'mention_positions_30',
-                                          'mention_positions_40 sum': 'mention_positions_40',
-                                          'mention_positions_50 sum': 'mention_positions_50',
-                                          'mention_positions_60 sum': 'mention_positions_60',
-                                          'mention_positions_70 sum': 'mention_positions_70', 
-                                          'mention_positions_80 sum': 'mention_positions_80', 
-                                          'mention_positions_90 sum': 'mention_positions_90',
-                                          'mention_positions_100 sum': 'mention_positions_100'}, inplace=True)
-
-
-    df_heading_category = df.loc[:,['citation_key_lr', 'citation_key_cp', 'heading_category']].drop_duplicates().reset_index()
-    df_heading_category['heading_category_NA'] = 0
-    df_heading_category['heading_category_intro'] = 0
-    df_heading_category['heading_category_background'] = 0
-    df_heading_category['heading_category_theory'] = 0
-    df_heading_category['heading_category_methods'] = 0
-    df_heading_category['heading_category_results'] = 0
-    df_heading_category['heading_category_implications'] = 0
-    df_heading_category['heading_category_appendix'] = 0
-    
-    
-    for i,row in df_heading_category.iterrows():
-        # test for NaN
-        if row['heading_category'] == '-':
-            df_heading_category.at[i, 'heading_category_NA'] +=1
-        if row['heading_category'] == 'introduction':
-            df_heading_category.at[i, 'heading_category_intro'] +=1
-        if row['heading_category'] == 'background':
-            df_heading_category.at[i, 'heading_category_background'] +=1
-        if row['heading_category'] == 'theory_frontend':
-            df_heading_category.at[i, 'heading_category_theory'] +=1
-        if row['heading_category'] == 'method':
-            df_heading_category.at[i, 'heading_category_methods'] +=1
-        if row['heading_category'] == 'results':
-            df_heading_category.at[i, 'heading_category_results'] +=1
-        if row['heading_category'] == 'implications':
-            df_heading_category.at[i, 'heading_category_implications'] +=1
-        if row['heading_category'] == 'appendix':
-            df_heading_category.at[i, 'heading_category_appendix'] +=1
-        
-    df_heading_category = df_heading_category.groupby(['citation_key_lr', 'citation_key_cp']).agg([np.sum])
-    df_heading_category = df_heading_category.reset_index()
-    df_heading_category.columns = [' '.join(col).strip() for col in df_heading_category.columns.values]
-    df_heading_category.drop(columns = ['heading_category sum'], inplace=True)
-    df_heading_category.rename(columns={'heading_category_intro sum': 'heading_category_intro',
-                                          'heading_category_background sum': 'heading_category_background',
-                                          'heading_category_theory sum': 'heading_category_theory',
-                                          'heading_category_methods sum': 'heading_category_methods',
-                                          'heading_category_results sum': 'heading_category_results',
-                                          'heading_category_implications sum': 'heading_category_implications',
-                                          'heading_category_appendix sum': 'heading_category_appendix',
-                                          'heading_category_NA sum': 'heading_category_NA'}, inplace=True)
+    df_counts = get_mention_heading_counts(df)
 
     df = pd.merge(df_keys, df_bool, on=['citation_key_lr', 'citation_key_cp'])
     df = pd.merge(df, df_else, on=['citation_key_lr', 'citation_key_cp'])
-    df = pd.merge(df, df_mention_position, on=['citation_key_lr', 'citation_key_cp'])
-    df = pd.merge(df, df_heading_category, on=['citation_key_lr', 'citation_key_cp'])
+    df = pd.merge(df, df_counts, on=['citation_key_lr', 'citation_key_cp'])
     return df
 
-if __name__ == '__main__':
-    CITATION = pd.read_csv('data/interim/CITATION.csv')
+def load_inputs():
+    # citations extracted with a narrower feature selection lack some columns
+    available = storage.table_columns('CITATION')
+    CITATION = storage.read_table('CITATION', columns=[column for column in citation_columns if column in available])
+    LR_CP = storage.read_table('LR_CP')
+    LR = pd.read_csv('data/interim/LR.csv', usecols=['citation_key_lr', 'SYN', 'TT', 'TB', 'RG', 'CRI', 'RA'])
+    CP = pd.read_csv('data/interim/CP.csv', usecols=['citation_key_cp', 'total_references', 'total_citations'])
+    return CITATION, LR_CP, LR, CP
+
+def build_feature_frame(CITATION, LR_CP, LR, CP):
+    key_index = build_key_index(CITATION, LR_CP, LR, CP)
+    CITATION, LR_CP, LR, CP = [compact(intern_keys(df, key_index)) for df in [CITATION, LR_CP, LR, CP]]
+
     FEATURE_FRAME = prepare_dataframe(CITATION)
+    # the texts are only needed for the topic features
+    CITATION.drop(columns=['predecessor', 'successor', 'context'], inplace=True)
 
-    CITATION_summary = summarize_citation_df(CITATION)
-    FEATURE_FRAME = pd.merge(FEATURE_FRAME, CITATION_summary, on=['citation_key_lr', 'citation_key_cp'])
+    TOPICS = compact(get_topic_features(FEATURE_FRAME))
+    topic_columns = [column for column in TOPICS.columns if column.startswith('topic_')]
+    FEATURE_FRAME = pd.merge(FEATURE_FRAME, TOPICS, on=['citation_key_lr', 'citation_key_cp'])
+    FEATURE_FRAME.drop(columns=['context'], inplace=True)
 
-    LR_CP = pd.read_csv('data/interim/LR_CP.csv')
+    CITATION_summary = compact(summarize_citation_df(CITATION))
+    FEATURE_FRAME = pd.merge(FEATURE_FRAME, CITATION_summary, on=['citation_key_lr', 'citation_key_cp'])
     FEATURE_FRAME = pd.merge(FEATURE_FRAME, LR_CP, on=['citation_key_lr', 'citation_key_cp'])
+    FEATURE_FRAME = pd.merge(FEATURE_FRAME, LR, on='citation_key_lr')
+    FEATURE_FRAME = pd.merge(FEATURE_FRAME, CP, on='citation_key_cp')
+    FEATURE_FRAME['weighted_citation_count'] = (FEATURE_FRAME['focal_citations'] / FEATURE_FRAME['total_citations']).astype(np.float32)
+    report_memory(FEATURE_FRAME)
+    FEATURE_FRAME = restore_keys(FEATURE_FRAME, key_index)
 
-    LR = pd.read_csv('data/interim/LR.csv')
-    FEATURE_FRAME = pd.merge(FEATURE_FRAME, LR.loc[:,['citation_key_lr', 'SYN','TT','TB','RG','CRI','RA']], on='citation_key_lr')
+    FEATURE_FRAME['USE'] = FEATURE_FRAME['NOT'] == False
+    FEATURE_FRAME.drop(columns = ['NOT'], inplace=True)
+    columns = (['citation_key_lr',
+                'citation_key_cp',
+                'focal_citations',
+                'textual',
+                'separate',
+                'comp_sup',
+                'prp',
+                'pos_0',
+                'pos_1',
+                'pos_2',
+                'pos_3',
+                'pos_4',
+                'pos_5',
+                'sentence_popularity amin',
+                'sentence_popularity amax',
+                'sentence_popularity mean',
+                'context_popularity amin',
+                'context_popularity amax',
+                'context_popularity mean',
+                'sentence_density amin',
+                'sentence_density amax',
+                'sentence_density mean',
+                'context_density amin',
+                'context_density amax',
+                'context_density mean',
+                'position_in_sentence amin',
+                'position_in_sentence amax',
+                'position_in_sentence mean',
+                'sentence_neg amin',
+                'sentence_neg amax',
+                'sentence_neg mean',
+                'sentence_neu amin',
+                'sentence_neu amax',
+                'sentence_neu mean',
+                'sentence_pos amin',
+                'sentence_pos amax',
+                'sentence_pos mean',
+                'sentence_compound amin',
+                'sentence_compound amax',
+                'sentence_compound mean',
+                'context_neg amin',
+                'context_neg amax',
+                'context_neg mean',
+                'context_neu amin',
+                'context_neu amax',
+                'context_neu mean',
+                'context_pos amin',
+                'context_pos amax',
+                'context_pos mean',
+                'context_compound amin',
+                'context_compound amax',
+                'context_compound mean',
+                'self_citation',
+                'title_similarity',
+                'abstract_similarity',
+                'SYN',
+                'TT',
+                'TB',
+                'RG',
+                'CRI',
+                'RA',
+                'total_references',
+                'total_citations',
+                'weighted_citation_count',
+                'mention_positions_10',
+                'mention_positions_20',
+                'mention_positions_30',
+                'mention_positions_40',
+                'mention_positions_50',
+                'mention_positions_60',
+                'mention_positions_70',
+                'mention_positions_80',
+                'mention_positions_90',
+                'mention_positions_100',
+                'heading_category_NA',
+                'heading_category_intro',
+                'heading_category_background',
+                'heading_category_theory',
+                'heading_category_methods',
+                'heading_category_results',
+                'heading_category_implications',
+                'heading_category_appendix',
+                'ref_in_title',
+                'ref_in_heading',
+                'ref_in_figure_description',
+                'ref_in_table_description'] +
+                topic_columns +
+               ['SYN_TB',
+                'CRI_ADDR',
+                'RG_SYN',
+                'RG_CLOSE',
+                'RA_CLOSE',
+                'TB_TB',
+                'TB_TT',
+                'TB_RG',
+                'TT_TT',
+                'TT_RG',
+                'USE'])
+    # features left out of the citation extraction are left out of the frame
+    return FEATURE_FRAME[[column for column in columns if column in FEATURE_FRAME]]
 
-    CP = pd.read_csv('data/interim/CP.csv')
-    FEATURE_FRAME = pd.merge(FEATURE_FRAME, CP.loc[:,['citation_key_cp', 'total_references', 'total_citations']], on='citation_key_cp')
-    FEATURE_FRAME['weighted_citation_count'] = FEATURE_FRAME['focal_citations'] / FEATURE_FRAME['total_citations']
+def hash_rows(df):
+    return pd.util.hash_pandas_object(df, index=False).values
 
-    FEATURE_FRAME['USE'] = FEATURE_FRAME['NOT'] == False
-    FEATURE_FRAME.drop(columns = ['context', 'NOT'], inplace=True)
-    FEATURE_FRAME = FEATURE_FRAME[['citation_key_lr',
-                                    'citation_key_cp',
-                                    'focal_citations',
-                                    'textual',
-                                    'separate',
-                                    'comp_sup',
-                                    'prp',
-                                    'pos_0',
-                                    'pos_1',
-                                    'pos_2',
-                                    'pos_3',
-                                    'pos_4',
-                                    'pos_5',
-                                    'sentence_popularity amin',
-                                    'sentence_popularity amax',
-                                    'sentence_popularity mean',
-                                    'context_popularity amin',
-                                    'context_popularity amax',
-                                    'context_popularity mean',
-                                    'sentence_density amin',
-                                    'sentence_density amax',
-                                    'sentence_density mean',
-                                    'context_density amin',
-                                    'context_density amax',
-                                    'context_density mean',
-                                    'position_in_sentence amin',
-                                    'position_in_sentence amax',
-                                    'position_in_sentence mean',
-                                    'sentence_neg amin',
-                                    'sentence_neg amax',
-                                    'sentence_neg mean',
-                                    'sentence_neu amin',
-                                    'sentence_neu amax',
-                                    'sentence_neu mean',
-                                    'sentence_pos amin',
-                                    'sentence_pos amax',
-                                    'sentence_pos mean',
-                                    'sentence_compound amin',
-                                    'sentence_compound amax',
-                                    'sentence_compound mean',
-                                    'context_neg amin',
-                                    'context_neg amax',
-                                    'context_neg mean',
-                                    'context_neu amin',
-                                    'context_neu amax',
-                                    'context_neu mean',
-                                    'context_pos amin',
-                                    'context_pos amax',
-                                    'context_pos mean',
-                                    'context_compound amin',
-                                    'context_compound amax',
-                                    'context_compound mean',
-                                    'self_citation',
-                                    'title_similarity',
-                                    'abstract_similarity',
-                                    'SYN',
-                                    'TT',
-                                    'TB',
-                                    'RG',
-                                    'CRI',
-                                    'RA',
-                                    'total_references',
-                                    'total_citations',
-                                    'weighted_citation_count',
-                                    'mention_positions_10',
-                                    'mention_positions_20',
-                                    'mention_positions_30',
-                                    'mention_positions_40',
-                                    'mention_positions_50',
-                                    'mention_positions_60',
-                                    'mention_positions_70',
-                                    'mention_positions_80',
-                                    'mention_positions_90',
-                                    'mention_positions_100',
-                                    'heading_category_NA',
-                                    'heading_category_intro',
-                                    'heading_category_background',
-                                    'heading_category_theory',
-                                    'heading_category_methods',
-                                    'heading_category_results',
-                                    'heading_category_implications',
-                                    'heading_category_appendix',
-                                    'ref_in_title',
-                                    'ref_in_heading',
-                                    'ref_in_figure_description',
-                                    'ref_in_table_description',
-                                    'SYN_TB',
-                                    'CRI_ADDR',
-                                    'RG_SYN',
-                                    'RG_CLOSE',
-                                    'RA_CLOSE',
-                                    'TB_TB',
-                                    'TB_TT',
-                                    'TB_RG',
-                                    'TT_TT',
-                                    'TT_RG',
-                                    'USE']]
-    FEATURE_FRAME.to_csv('data/processed/FEATURE_FRAME.csv', index=False, quoting=csv.QUOTE_ALL)
+def hash_model():
+    # topic features change with the lda model and its preprocessing pipeline
+    # the model arrays are stored next to lda.model as separate .npy files, every one of them is hashed
+    model_dir = lda_params['model_dir']
+    model_files = sorted(name for name in os.listdir(model_dir) if name.startswith('lda.model') or name == 'lda.dict') if os.path.isdir(model_dir) else []
+    stamp = ' '.join(name + ' ' + hash_file(model_dir + name) for name in model_files)
+    return token_cache.hash_text(stamp + token_cache.hash_config(lda_pipeline_config()))
+
+def hash_inputs(CITATION, LR_CP, LR, CP):
+    # one hash per pair over its CITATION rows, its LR_CP row, its LR row, its CP row and the lda model
+    keys = storage.keys
+    pairs = CITATION.groupby(keys, observed=True, sort=True).ngroup().values
+    order = np.argsort(pairs, kind='mergesort')
+    starts = np.r_[0, np.flatnonzero(np.diff(pairs[order])) + 1]
+    hashes = pd.DataFrame({key: CITATION[key].astype(str).values[order[starts]] for key in keys})
+    hashes['citation_hash'] = np.add.reduceat(hash_rows(CITATION)[order], starts) if len(order) else np.zeros(0, dtype=np.uint64)
+
+    inputs = [(LR_CP, keys, 'lr_cp_hash'), (LR, ['citation_key_lr'], 'lr_hash'), (CP, ['citation_key_cp'], 'cp_hash')]
+    for df, on, column in inputs:
+        df = pd.DataFrame({key: df[key].astype(str).values for key in on}).assign(**{column: hash_rows(df)})
+        hashes = pd.merge(hashes, df.drop_duplicates(on), on=on, how='left')
+        hashes[column] = hashes[column].fillna(0).astype(np.uint64)
+    hashes['model_hash'] = hash_model()
+    hashes['input_hash'] = hash_rows(hashes.drop(columns=keys))
+    return hashes[keys + ['input_hash']]
+
+def has_pairs(df, pairs):
+    return (pd.merge(df[storage.keys].astype(str), pairs, on=storage.keys, how='left', indicator=True)['_merge'] == 'both').values
+
+def sort_pairs(df):
+    df = df.copy()
+    for key in storage.keys:
+        df[key] = df[key].astype(str)
+    return df.sort_values(storage.keys).reset_index(drop=True)
+
+def refresh_feature_frame(full=False, verify=False):
+    inputs = load_inputs()
+    hashes = hash_inputs(*inputs)
+    if full or not os.path.exists(storage.paths['FEATURE_FRAME']) or not os.path.exists(storage.paths['FEATURE_HASHES']):
+        logging.info('feature frame: full build of %i pairs', len(hashes))
+        FEATURE_FRAME = sort_pairs(build_feature_frame(*inputs))
+    else:
+        FEATURE_FRAME = sort_pairs(storage.read_table('FEATURE_FRAME'))
+        previous = storage.read_table('FEATURE_HASHES')
+        previous = pd.DataFrame({key: previous[key].astype(str) for key in storage.keys}).assign(previous_hash=previous['input_hash'].values)
+        compared = pd.merge(hashes, previous, on=storage.keys, how='left')
+        changed = compared.loc[compared['input_hash'] != compared['previous_hash'], storage.keys]
+        # pairs without citations any more and pairs that are recomputed leave the table
+        current = has_pairs(FEATURE_FRAME, hashes[storage.keys])
+        kept = current & ~has_pairs(FEATURE_FRAME, changed)
+        logging.info('feature frame: %i pairs recomputed, %i removed, %i unchanged', len(changed), (~current).sum(), kept.sum())
+        FEATURE_FRAME = FEATURE_FRAME[kept]
+        if len(changed):
+            CITATION, LR_CP, LR, CP = inputs
+            UPDATES = build_feature_frame(CITATION[has_pairs(CITATION, changed)], LR_CP[has_pairs(LR_CP, changed)], LR, CP)
+            FEATURE_FRAME = sort_pairs(pd.concat([FEATURE_FRAME, UPDATES], ignore_index=True, sort=False)[UPDATES.columns])
+        else:
+            FEATURE_FRAME = FEATURE_FRAME.reset_index(drop=True)
+
+    if verify:
+        verify_feature_frame(FEATURE_FRAME, inputs)
+
+    storage.write_table(FEATURE_FRAME, 'FEATURE_FRAME')
+    storage.write_table(hashes, 'FEATURE_HASHES')
+    storage.export_csv(FEATURE_FRAME, 'data/processed/FEATURE_FRAME.csv')
+    export_matrix(FEATURE_FRAME)
+
+def export_matrix(FEATURE_FRAME, path=None):
+    # model input without the keys, the label and the coding it is derived from
+    path = path or storage.paths['FEATURE_MATRIX']
+    FEATURE_FRAME = storage.apply_schema(FEATURE_FRAME, 'FEATURE_FRAME')
+    excluded = storage.keys + ['USE'] + storage.coding_columns
+    columns = [column for column in FEATURE_FRAME.columns if column not in excluded]
+    features = storage.feature_matrix(FEATURE_FRAME, columns)
+    metadata = dict(label='USE',
+                    rows=len(FEATURE_FRAME),
+                    columns=[dict(index=i, name=column, dtype=str(FEATURE_FRAME[column].dtype)) for i, column in enumerate(columns)])
+    keys = pd.DataFrame({key: FEATURE_FRAME[key].astype(str).values for key in storage.keys})
+    artifacts.save_matrix(path, keys, features, FEATURE_FRAME['USE'].values, metadata)
+    logging.info('feature matrix: %i rows, %i columns, %.1f MB', features.shape[0], features.shape[1], features.nbytes / 1024 ** 2)
+
+def verify_feature_frame(FEATURE_FRAME, inputs, rtol=1e-5, atol=1e-6):
+    # compares the refreshed table to a full rebuild, raises on any difference beyond float32 rounding
+    REBUILT = storage.apply_schema(sort_pairs(build_feature_frame(*inputs)), 'FEATURE_FRAME')
+    FEATURE_FRAME = storage.apply_schema(FEATURE_FRAME, 'FEATURE_FRAME')
+    REBUILT = REBUILT[FEATURE_FRAME.columns]
+    # rtol/atol of assert_frame_equal need pandas 1.1, the float columns are compared with numpy instead
+    floats = [column for column in FEATURE_FRAME.columns if FEATURE_FRAME[column].dtype.kind == 'f']
+    others = [column for column in FEATURE_FRAME.columns if column not in floats]
+    pd.testing.assert_frame_equal(FEATURE_FRAME[others], REBUILT[others], check_categorical=False)
+    for column in floats:
+        np.testing.assert_allclose(FEATURE_FRAME[column].values, REBUILT[column].values, rtol=rtol, atol=atol, equal_nan=True, err_msg=column)
+    logging.info('feature frame: %i pairs consistent with a full rebuild', len(FEATURE_FRAME))
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Build the feature frame for the machine learning classifier')
+    parser.add_argument('--full', action='store_true', help='rebuild every pair instead of only pairs whose inputs changed')
+    parser.add_argument('--verify', action='store_true', help='check the refreshed feature frame against a full rebuild')
+    args = parser.parse_args()
+    refresh_feature_frame(args.full, args.verify)
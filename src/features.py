@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import collections
+
+# a feature produces one or more CITATION columns from the citing sentence and its surroundings
+# inputs: what the feature reads, requires: features whose values it builds on, cost: tier it belongs to
+Feature = collections.namedtuple('Feature', ['name', 'columns', 'inputs', 'requires', 'cost'])
+
+registry = collections.OrderedDict((feature.name, feature) for feature in [
+    Feature('textual', ['textual'], ['sentence'], [], 'fast'),
+    Feature('separate', ['separate'], ['sentence'], [], 'fast'),
+    Feature('popularity', ['sentence_popularity', 'context_popularity'], ['sentence', 'context'], [], 'fast'),
+    Feature('density', ['sentence_density', 'context_density'], ['sentence', 'context'], [], 'fast'),
+    Feature('position_in_sentence', ['position_in_sentence'], ['sentence'], [], 'fast'),
+    Feature('sentence_sentiment', ['sentence_neg', 'sentence_neu', 'sentence_pos', 'sentence_compound'], ['sentence'], [], 'sentiment'),
+    Feature('context_sentiment', ['context_neg', 'context_neu', 'context_pos', 'context_compound'], ['context'], [], 'sentiment'),
+    Feature('pos_structure', ['pos_pattern'], ['sentence'], [], 'pos'),
+    Feature('comp_sup', ['comp_sup'], ['sentence'], ['pos_structure'], 'pos'),
+    Feature('prp', ['prp'], ['sentence'], [], 'pos'),
+    Feature('pos_patterns', ['pos_0', 'pos_1', 'pos_2', 'pos_3', 'pos_4', 'pos_5'], ['sentence'], ['pos_structure'], 'pos'),
+    Feature('position_in_document', ['position_in_document'], ['document', 'predecessor', 'sentence', 'successor'], [], 'fast'),
+    Feature('heading', ['heading_title'], ['paragraph'], [], 'fast'),
+    Feature('heading_category', ['heading_category'], ['headings'], ['heading', 'position_in_document'], 'fast'),
+    Feature('ref_in_figure_description', ['ref_in_figure_description'], ['reference'], ['heading'], 'fast'),
+    Feature('ref_in_table_description', ['ref_in_table_description'], ['reference'], ['heading'], 'fast'),
+    Feature('ref_in_heading', ['ref_in_heading'], ['reference'], ['heading'], 'fast')
+])
+
+tiers = dict(
+    fast = ['fast'],
+    full = ['fast', 'sentiment', 'pos']
+)
+
+# written for every citation whatever features are selected
+key_columns = ['citation_key_lr', 'citation_key_cp', 'citation_sentence', 'predecessor', 'successor']
+
+# column order of CITATION
+citation_columns = key_columns + ['textual',
+                                  'separate',
+                                  'sentence_popularity',
+                                  'context_popularity',
+                                  'sentence_density',
+                                  'context_density',
+                                  'position_in_sentence',
+                                  'sentence_neg',
+                                  'sentence_neu',
+                                  'sentence_pos',
+                                  'sentence_compound',
+                                  'context_neg',
+                                  'context_neu',
+                                  'context_pos',
+                                  'context_compound',
+                                  'comp_sup',
+                                  'prp',
+                                  'pos_pattern',
+                                  'pos_0',
+                                  'pos_1',
+                                  'pos_2',
+                                  'pos_3',
+                                  'pos_4',
+                                  'pos_5',
+                                  'position_in_document',
+                                  'heading_title',
+                                  'heading_category',
+                                  'ref_in_figure_description',
+                                  'ref_in_table_description',
+                                  'ref_in_heading']
+
+def select_features(columns=None, tier='full'):
+    # features of the tier, narrowed to those producing the requested columns, plus everything they require
+    names = [name for name, feature in registry.items() if feature.cost in tiers[tier]]
+    if columns is not None:
+        names = [name for name in names if set(registry[name].columns) & set(columns)]
+        missing = set(columns) - set(key_columns) - set(column for name in names for column in registry[name].columns)
+        if missing:
+            raise ValueError('columns not produced by the ' + tier + ' tier: ' + ', '.join(sorted(missing)))
+    selected = set()
+    while names:
+        name = names.pop()
+        if name not in selected:
+            selected.add(name)
+            names.extend(registry[name].requires)
+    # registry order keeps requirements ahead of the features building on them
+    return [name for name in registry if name in selected]
+
+def output_columns(selected):
+    columns = set(column for name in selected for column in registry[name].columns)
+    return [column for column in citation_columns if column in key_columns or column in columns]
@@ -2,65 +2,204 @@
 # -*- coding: utf-8 -*-
 
 import pandas as pd
+import argparse
+import json
 import logging
+import resource
+import numpy as np
 import gensim
 import os
 import time
-import pickle
+import itertools
+import multiprocessing as mp
 import preprocessing
+import artifacts
+import storage
+import token_cache
+import vocabulary
+from config import lda_params, lda_pipeline_config, sweep_params
 
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 
-lda_params = dict(
-    model_dir = 'models/lda/',
-    num_topics = 50,
-    num_passes = 50,
-    markers = True,
-    tokenize = True,
-    punctuation = True,
-    numbers = True,
-    common_stopwords = True,
-    custom_stopwords = True,
-    bigrams = True,
-    trigrams = True,
-    lemmatize = True,
-    pos_tags = ('NN', 'VB')
-)
-
 def generate_dictionary(documents):
-    return gensim.corpora.Dictionary(documents)
+    dictionary = vocabulary.create_dictionary(lda_params, documents)
+    return dictionary, prune_dictionary(dictionary)
+
+def prune_dictionary(dictionary):
+    # per term the model holds the topic-word sufficient statistics and expElogbeta
+    return vocabulary.prune_dictionary(dictionary, lda_params, bytes_per_term=2 * lda_params['num_topics'] * 8)
 
 def generate_corpus(documents, dictionary):
     return [dictionary.doc2bow(doc) for doc in documents]
 
-def generate_lda_model(corpus, dictionary, num_topics):
-    lda = gensim.models.ldamulticore.LdaMulticore
-    return lda(corpus, num_topics=num_topics, id2word = dictionary, batch=True, random_state=0, iterations=500, passes=lda_params['num_passes'])
+def get_topic_word_matrix(lda_model):
+    topics = lda_model.state.get_lambda()
+    return topics / topics.sum(axis=1)[:, np.newaxis]
 
-def read_documents(context=True):
-    CITATION = pd.read_csv('data/interim/CITATION.csv')
+def get_topic_drift(previous, current):
+    # mean hellinger distance between the topic-word distributions of two passes
+    return float(np.mean(np.sqrt(0.5 * np.sum((np.sqrt(previous) - np.sqrt(current)) ** 2, axis=1))))
+
+def get_max_rss():
+    # peak resident memory in MB of this process and of the largest finished worker process, ru_maxrss is a per-process peak
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024)
+
+def train_lda_model(corpus, dictionary, num_topics, passes):
+    return gensim.models.ldamulticore.LdaMulticore(corpus, num_topics=num_topics, id2word=dictionary, batch=True, random_state=0, iterations=500, passes=passes)
+
+def select_num_passes(train, dictionary, num_topics, holdout=None):
+    # stops once held-out perplexity (or topic drift without holdout) stops improving
+    # gensim counts every update call as new documents, so these updates only choose the pass count and the model is discarded
+    metrics = dict(converged=False, passes=[])
+    t0 = time.time()
+    lda_model = None
+    topics = None
+    perplexity = None
+    for pass_ in range(1, lda_params['num_passes'] + 1):
+        t1 = time.time()
+        if lda_model is None:
+            lda_model = train_lda_model(train, dictionary, num_topics, 1)
+        else:
+            lda_model.update(train)
+        t2 = time.time()
+
+        previous_topics, topics = topics, get_topic_word_matrix(lda_model)
+        drift = get_topic_drift(previous_topics, topics) if previous_topics is not None else None
+        previous_perplexity = perplexity
+        if holdout is not None and len(holdout) > 0:
+            perplexity = 2 ** -lda_model.log_perplexity(holdout)
+        improvement = (previous_perplexity - perplexity) / previous_perplexity if previous_perplexity and perplexity else None
+        max_rss_mb, children_max_rss_mb = get_max_rss()
+        metrics['passes'].append(dict(pass_number=pass_,
+                                      training_time=t2-t1,
+                                      evaluation_time=time.time()-t2,
+                                      elapsed_time=time.time()-t0,
+                                      max_rss_mb=max_rss_mb,
+                                      children_max_rss_mb=children_max_rss_mb,
+                                      perplexity=perplexity,
+                                      improvement=improvement,
+                                      drift=drift))
+        logging.info('pass %i: perplexity %s, improvement %s, drift %s', pass_, perplexity, improvement, drift)
+
+        if pass_ < lda_params['min_passes']:
+            continue
+        if improvement is not None and improvement < lda_params['min_improvement']:
+            metrics['converged'] = True
+        elif perplexity is None and drift is not None and drift < lda_params['min_drift']:
+            metrics['converged'] = True
+        if metrics['converged']:
+            break
+    return len(metrics['passes']), metrics
+
+def generate_lda_model(corpus, dictionary, num_topics, train=None, holdout=None):
+    # the saved model is a single multi-pass fit on all documents, early stopping only chooses its number of passes
+    # selection trains a model of its own that is discarded, so it can cost up to num_passes extra passes
+    metrics = dict(num_topics=num_topics, max_passes=lda_params['num_passes'])
+    num_passes = lda_params['num_passes']
+    t0 = time.time()
+    if lda_params['early_stopping']:
+        num_passes, selection = select_num_passes(corpus if train is None else train, dictionary, num_topics, holdout)
+        # the per-pass metrics describe the selection model, not the saved one
+        metrics['selection'] = selection
+    t1 = time.time()
+    lda_model = train_lda_model(corpus, dictionary, num_topics, num_passes)
+    t2 = time.time()
+    logging.info('trained %i passes on %i documents', num_passes, len(corpus))
+
+    max_rss_mb, children_max_rss_mb = get_max_rss()
+    metrics.update(passes_trained=num_passes,
+                   selection_time=t1-t0,
+                   training_time=t2-t1,
+                   max_rss_mb=max_rss_mb,
+                   children_max_rss_mb=children_max_rss_mb)
+    return lda_model, metrics
+
+def split_holdout(documents):
+    # the holdout only serves to choose the number of passes
+    if not lda_params['early_stopping'] or not lda_params['holdout_every']:
+        return documents, []
+    train = [doc for i, doc in enumerate(documents) if i % lda_params['holdout_every'] != 0]
+    holdout = [doc for i, doc in enumerate(documents) if i % lda_params['holdout_every'] == 0]
+    return train, holdout
+
+citation_columns = ['citation_key_lr', 'citation_key_cp', 'citation_sentence', 'predecessor', 'successor']
+
+def documents_frame(CITATION):
+    # plain string keys, grouping on the categorical keys would produce every combination of reviews and papers
+    for key in storage.keys:
+        CITATION[key] = CITATION[key].astype(str)
     CITATION = CITATION.dropna(subset=['citation_sentence'])
-    CITATION = CITATION.fillna('')
+    return CITATION.fillna('')
+
+def read_keyed_documents(context=True):
+    # ((citation_key_lr, citation_key_cp), document) per pair
+    CITATION = storage.read_table('CITATION', columns=citation_columns)
+    CITATION = documents_frame(CITATION)
     CITATION['citation_sentence'] = CITATION['citation_sentence'].astype(str)
     if context:
         CITATION['predecessor'] = CITATION['predecessor'].astype(str)
         CITATION['successor'] = CITATION['successor'].astype(str)
         CITATION['context'] = CITATION['predecessor'] + ' ' + CITATION['citation_sentence'] + ' ' + CITATION['successor']
         CITATION = CITATION.groupby(['citation_key_lr', 'citation_key_cp'])['context'].apply(lambda x: ' '.join(x)).reset_index()
-        documents = CITATION['context'].dropna().tolist()
+        CITATION = CITATION.dropna(subset=['context'])
+        documents = CITATION['context'].tolist()
     else:
         CITATION = CITATION.groupby(['citation_key_lr', 'citation_key_cp'])['citation_sentence'].apply(lambda x: ' '.join(x)).reset_index()
-        documents = CITATION['citation_sentence'].dropna().tolist()
-    return documents
+        CITATION = CITATION.dropna(subset=['citation_sentence'])
+        documents = CITATION['citation_sentence'].tolist()
+    return list(zip(zip(CITATION['citation_key_lr'], CITATION['citation_key_cp']), documents))
 
-def build_model(documents):
+def read_documents(context=True):
+    return [doc for key, doc in read_keyed_documents(context)]
+
+def iter_keyed_documents(context=True):
+    # rows of CITATION are sorted by citation keys, so the documents of a pair can be joined row group by row group
+    key = None
+    parts = []
+    for CITATION in storage.iter_row_groups('CITATION', columns=citation_columns):
+        CITATION = documents_frame(CITATION)
+        CITATION['citation_sentence'] = CITATION['citation_sentence'].astype(str)
+        if context:
+            CITATION['citation_sentence'] = CITATION['predecessor'].astype(str) + ' ' + CITATION['citation_sentence'] + ' ' + CITATION['successor'].astype(str)
+        for citation_key_lr, citation_key_cp, text in zip(CITATION['citation_key_lr'], CITATION['citation_key_cp'], CITATION['citation_sentence']):
+            if (citation_key_lr, citation_key_cp) != key:
+                if parts:
+                    yield key, ' '.join(parts)
+                key = (citation_key_lr, citation_key_cp)
+                parts = []
+            parts.append(text)
+    if parts:
+        yield key, ' '.join(parts)
+
+def iter_batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class TokenFile(object):
+    # preprocessed documents stored one per line, tokens separated by blanks
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        with open(self.path, 'r') as tokens_file:
+            for line in tokens_file:
+                yield line.split()
+
+def preprocess_corpus(documents):
     if lda_params['markers']:
         documents = map(preprocessing.remove_markers, documents)
     if lda_params['tokenize']:
         documents = map(preprocessing.tokenize, documents)
     documents = list(documents)
     if lda_params['pos_tags'] != ():
-        tags = [preprocessing.lower(preprocessing.filter_pos_tags(doc, tags=lda_params['pos_tags'])) for doc in documents]
+        tags = [preprocessing.lower(doc) for doc in preprocessing.filter_corpus_pos_tags(documents, tags=lda_params['pos_tags'])]
     if lda_params['punctuation']:
         documents = [preprocessing.remove_punctuation(doc) for doc in documents]
     if lda_params['numbers']:
@@ -88,29 +227,263 @@ def build_model(documents):
     if lda_params['bigrams'] and lda_params['trigrams']:
         documents = [documents[i] + bigrams[i] + trigrams[i] for i in range(0, len(documents))]
     if lda_params['lemmatize']:
-        documents = [preprocessing.lemmatize(doc) for doc in documents]
+        documents = preprocessing.lemmatize_corpus(documents)
     documents = [preprocessing.clean_doc(doc) for doc in documents]
+    return documents
+
+def stream_preprocessed(documents):
+    for batch in iter_batches(documents, lda_params['stream_batch_size']):
+        for doc in token_cache.get_tokens(batch, preprocess_corpus, lda_pipeline_config()):
+            if doc:
+                yield doc
+
+def save_model(dictionary, lda_model, metrics):
+    dictionary.save(lda_params['model_dir'] + 'lda.dict')
+    artifacts.save_model(lda_model, lda_params['model_dir'] + 'lda.model')
+    with open(lda_params['model_dir'] + 'lda_training.json', 'w') as metrics_file:
+        json.dump(metrics, metrics_file, indent=2)
+    with open(lda_params['model_dir'] + 'lda_params.config', 'w') as config_file:
+        config_file.write(str(lda_params))
+
+def format_key(key, doc):
+    return '{}\t{}\t{}\n'.format(key[0], key[1], token_cache.hash_text(doc))
+
+def record_keys(keys_file, documents):
+    # pair keys and content hashes of the raw documents a model has seen, used to find new and changed pairs on update
+    for key, doc in documents:
+        keys_file.write(format_key(key, doc))
+        yield doc
+
+def read_keys():
+    # (citation_key_lr, citation_key_cp) -> content hash, None for key files without pair keys
+    keys = {}
+    with open(lda_params['model_dir'] + 'lda.keys', 'r') as keys_file:
+        for line in keys_file:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 3:
+                return None
+            keys[(fields[0], fields[1])] = fields[2]
+    return keys
+
+# bag-of-words of the documents added by online updates since the last build, lda.mm plus this delta is the training corpus
+delta_file = 'lda.delta.mm'
+
+def build_model(documents):
+    keyed_documents = list(documents)
+    documents = token_cache.get_tokens([doc for key, doc in keyed_documents], preprocess_corpus, lda_pipeline_config())
     documents = [doc for doc in documents if doc]
-    
-    dictionary = generate_dictionary(documents)
+
+    dictionary, vocabulary_report = generate_dictionary(documents)
+    train, holdout = split_holdout(documents)
     corpus = generate_corpus(documents, dictionary)
-    lda_model = generate_lda_model(corpus, dictionary, lda_params['num_topics'])
+    lda_model, metrics = generate_lda_model(corpus, dictionary, lda_params['num_topics'], train=generate_corpus(train, dictionary), holdout=generate_corpus(holdout, dictionary))
+    metrics['vocabulary'] = vocabulary_report
 
     if not os.path.exists(lda_params['model_dir']):
         os.makedirs(lda_params['model_dir'])
-    dictionary.save(lda_params['model_dir'] + 'lda.dict')
     gensim.corpora.MmCorpus.serialize(lda_params['model_dir'] + 'lda.mm', corpus)
-    lda_model.save(lda_params['model_dir'] + 'lda.model')
-    with open(lda_params['model_dir'] + 'lda.docs', 'wb') as docs_file:
-        pickle.dump(documents, docs_file, pickle.HIGHEST_PROTOCOL)
-    with open(lda_params['model_dir'] + 'lda_params.config', 'w') as config_file:
-        config_file.write(str(lda_params))
+    remove_delta()
+    artifacts.save_docs(lda_params['model_dir'] + 'lda.docs', documents)
+    with open(lda_params['model_dir'] + 'lda.keys', 'w') as keys_file:
+        keys_file.writelines(format_key(key, doc) for key, doc in keyed_documents)
+    save_model(dictionary, lda_model, metrics)
+
+def build_streamed_model(documents):
+    # documents only live in memory one batch at a time, the corpus is trained from disk
+    if not os.path.exists(lda_params['model_dir']):
+        os.makedirs(lda_params['model_dir'])
+    tokens_path = lda_params['model_dir'] + 'lda.tokens'
+    corpus_path = lda_params['model_dir'] + 'lda.mm'
+    train_tokens_path = lda_params['model_dir'] + 'lda.train.tokens'
+    train_path = lda_params['model_dir'] + 'lda.train.mm'
+    holdout_tokens_path = lda_params['model_dir'] + 'lda.holdout.tokens'
+    holdout_path = lda_params['model_dir'] + 'lda.holdout.mm'
+
+    # every document goes into the model corpus, the train/holdout split is only used to choose the number of passes
+    dictionary = vocabulary.create_dictionary(lda_params)
+    with open(tokens_path, 'w') as tokens_file, open(train_tokens_path, 'w') as train_file, open(holdout_tokens_path, 'w') as holdout_file, open(lda_params['model_dir'] + 'lda.keys', 'w') as keys_file:
+        for batch in iter_batches(enumerate(stream_preprocessed(record_keys(keys_file, documents))), lda_params['stream_batch_size']):
+            dictionary.add_documents([doc for i, doc in batch])
+            for i, doc in batch:
+                tokens_file.write(' '.join(doc) + '\n')
+                if lda_params['early_stopping'] and lda_params['holdout_every'] and i % lda_params['holdout_every'] == 0:
+                    holdout_file.write(' '.join(doc) + '\n')
+                else:
+                    train_file.write(' '.join(doc) + '\n')
+
+    vocabulary_report = prune_dictionary(dictionary)
+
+    gensim.corpora.MmCorpus.serialize(corpus_path, (dictionary.doc2bow(doc) for doc in TokenFile(tokens_path)), id2word=dictionary)
+    remove_delta()
+    artifacts.save_docs(lda_params['model_dir'] + 'lda.docs', TokenFile(tokens_path))
+    corpus = gensim.corpora.MmCorpus(corpus_path)
+    train = None
+    holdout = None
+    if lda_params['early_stopping']:
+        gensim.corpora.MmCorpus.serialize(train_path, (dictionary.doc2bow(doc) for doc in TokenFile(train_tokens_path)), id2word=dictionary)
+        gensim.corpora.MmCorpus.serialize(holdout_path, (dictionary.doc2bow(doc) for doc in TokenFile(holdout_tokens_path)), id2word=dictionary)
+        train = gensim.corpora.MmCorpus(train_path)
+        holdout = gensim.corpora.MmCorpus(holdout_path)
+    lda_model, metrics = generate_lda_model(corpus, dictionary, lda_params['num_topics'], train=train, holdout=holdout)
+    metrics['vocabulary'] = vocabulary_report
+    save_model(dictionary, lda_model, metrics)
+
+def get_baseline_perplexity():
+    with open(lda_params['model_dir'] + 'lda_training.json', 'r') as metrics_file:
+        metrics = json.load(metrics_file)
+    perplexities = [p['perplexity'] for p in metrics.get('selection', dict(passes=[]))['passes'] if p['perplexity'] is not None]
+    return perplexities[-1] if perplexities else None
+
+def remove_delta():
+    for path in [delta_file, delta_file + '.index']:
+        if os.path.exists(lda_params['model_dir'] + path):
+            os.remove(lda_params['model_dir'] + path)
+
+def update_model(documents):
+    # online update with the pairs the stored model has not seen, falls back to a full rebuild on drift
+    # an online update cannot take back what the model learned from a document, so changed or removed pairs rebuild too
+    documents = list(documents)
+    model_dir = lda_params['model_dir']
+    known = read_keys()
+    if known is None or not os.path.exists(model_dir + 'lda.docs.ids'):
+        logging.info('update: model files of an older format, rebuilding')
+        build_model(documents)
+        return
+    current = dict((key, token_cache.hash_text(doc)) for key, doc in documents)
+    changed = [key for key, content_hash in current.items() if key in known and known[key] != content_hash]
+    removed = [key for key in known if key not in current]
+    if changed or removed:
+        logging.info('update: %i changed and %i removed pairs, rebuilding', len(changed), len(removed))
+        build_model(documents)
+        return
+    new_keyed_documents = [(key, doc) for key, doc in documents if key not in known]
+    new_documents = [doc for key, doc in new_keyed_documents]
+    if not new_documents:
+        logging.info('update: no new documents')
+        return
+    new_tokens = token_cache.get_tokens(new_documents, preprocess_corpus, lda_pipeline_config())
+    new_tokens = [doc for doc in new_tokens if doc]
+
+    lda_model = gensim.models.ldamulticore.LdaMulticore.load(model_dir + 'lda.model')
+    dictionary = gensim.corpora.Dictionary.load(model_dir + 'lda.dict')
+
+    # the vocabulary of a trained model is fixed: new terms are counted, and too many of them trigger a rebuild
+    total_tokens = sum(len(doc) for doc in new_tokens)
+    oov_tokens = vocabulary.count_oov(dictionary, new_tokens)
+    oov_rate = oov_tokens / total_tokens if total_tokens else 0
+    new_corpus = generate_corpus(new_tokens, dictionary)
+    baseline_perplexity = get_baseline_perplexity()
+    perplexity = 2 ** -lda_model.log_perplexity(new_corpus) if new_corpus else None
+    logging.info('update: %i new documents, oov rate %.4f, perplexity %s (baseline %s)', len(new_tokens), oov_rate, perplexity, baseline_perplexity)
+
+    drifted = oov_rate > lda_params['max_oov_rate']
+    if baseline_perplexity and perplexity:
+        drifted = drifted or perplexity > baseline_perplexity * lda_params['max_perplexity_ratio']
+    if drifted:
+        logging.info('update: new documents drift from the model, rebuilding')
+        build_model(documents)
+        return
 
-if __name__ == '__main__':
     t0 = time.time()
-    documents = read_documents()
+    lda_model.update(new_corpus)
     t1 = time.time()
-    build_model(documents)
+
+    # only the delta corpus is rewritten, the corpus of the last build stays untouched
+    delta = gensim.corpora.MmCorpus(model_dir + delta_file) if os.path.exists(model_dir + delta_file) else []
+    gensim.corpora.MmCorpus.serialize(model_dir + 'lda.update.mm', itertools.chain(delta, new_corpus), id2word=dictionary)
+    os.replace(model_dir + 'lda.update.mm', model_dir + delta_file)
+    os.replace(model_dir + 'lda.update.mm.index', model_dir + delta_file + '.index')
+    artifacts.append_docs(model_dir + 'lda.docs', new_tokens)
+    with open(model_dir + 'lda.keys', 'a') as keys_file:
+        keys_file.writelines(format_key(key, doc) for key, doc in new_keyed_documents)
+    artifacts.save_model(lda_model, model_dir + 'lda.model')
+    with open(model_dir + 'lda_update.json', 'w') as update_file:
+        json.dump(dict(new_documents=len(new_tokens), oov_rate=oov_rate, perplexity=perplexity, baseline_perplexity=baseline_perplexity, update_time=t1-t0), update_file, indent=2)
+
+def write_tokens(path, documents):
+    with open(path, 'w') as tokens_file:
+        for doc in documents:
+            tokens_file.write(' '.join(doc) + '\n')
+
+def prepare_sweep_corpus():
+    # preprocess and serialize once, every candidate model reads the same files
+    sweep_dir = sweep_params['sweep_dir']
+    if not os.path.exists(sweep_dir):
+        os.makedirs(sweep_dir)
+    documents = token_cache.get_tokens(read_documents(), preprocess_corpus, lda_pipeline_config())
+    documents = [doc for doc in documents if doc]
+    train = [doc for i, doc in enumerate(documents) if i % sweep_params['holdout_every'] != 0]
+    holdout = [doc for i, doc in enumerate(documents) if i % sweep_params['holdout_every'] == 0]
+
+    dictionary, vocabulary_report = generate_dictionary(train)
+    dictionary.save(sweep_dir + 'lda.dict')
+    vocabulary.save_report(vocabulary_report, sweep_dir + 'lda_vocabulary.json')
+    gensim.corpora.MmCorpus.serialize(sweep_dir + 'train.mm', generate_corpus(train, dictionary))
+    gensim.corpora.MmCorpus.serialize(sweep_dir + 'holdout.mm', generate_corpus(holdout, dictionary))
+    write_tokens(sweep_dir + 'train.tokens', train)
+
+def train_sweep_candidate(num_topics, num_passes):
+    # runs inside a pool worker, so the model is trained on a single core
+    sweep_dir = sweep_params['sweep_dir']
+    dictionary = gensim.corpora.Dictionary.load(sweep_dir + 'lda.dict')
+    train = gensim.corpora.MmCorpus(sweep_dir + 'train.mm')
+    holdout = gensim.corpora.MmCorpus(sweep_dir + 'holdout.mm')
+
+    t0 = time.time()
+    lda_model = gensim.models.ldamodel.LdaModel(train, num_topics=num_topics, id2word=dictionary, update_every=0, random_state=0, iterations=sweep_params['iterations'], passes=num_passes)
+    t1 = time.time()
+    if sweep_params['coherence'] == 'u_mass':
+        coherence_model = gensim.models.CoherenceModel(model=lda_model, corpus=train, dictionary=dictionary, coherence='u_mass')
+    else:
+        coherence_model = gensim.models.CoherenceModel(model=lda_model, texts=list(TokenFile(sweep_dir + 'train.tokens')), dictionary=dictionary, coherence=sweep_params['coherence'])
+    coherence = coherence_model.get_coherence()
+    perplexity = 2 ** -lda_model.log_perplexity(holdout) if len(holdout) > 0 else float('nan')
     t2 = time.time()
-    with open(lda_params['model_dir'] + 'lda_performance.info', 'w') as perf_file:
-        perf_file.write('Total time elapsed:\t\t\t\t{}\nTime spent reading documents:\t\t\t{}\nTime spent building LDA:\t\t\t{}'.format(t2-t0, t1-t0, t2-t1))
+
+    model_file = 'lda_{}_{}.model'.format(num_topics, num_passes)
+    artifacts.save_model(lda_model, sweep_dir + model_file)
+    return dict(num_topics=num_topics, num_passes=num_passes, coherence=coherence, perplexity=perplexity, training_time=t1-t0, scoring_time=t2-t1, model_file=model_file)
+
+def run_sweep():
+    sweep_dir = sweep_params['sweep_dir']
+    prepare_sweep_corpus()
+    grid = list(itertools.product(sweep_params['num_topics'], sweep_params['num_passes']))
+    pool = mp.Pool(min(sweep_params['cores'], len(grid)))
+    results = pool.starmap(train_sweep_candidate, grid)
+    pool.close()
+    pool.join()
+
+    RESULTS = pd.DataFrame(results, columns=['num_topics', 'num_passes', 'coherence', 'perplexity', 'training_time', 'scoring_time', 'model_file'])
+    RESULTS = RESULTS.sort_values('coherence', ascending=False)
+    RESULTS.to_csv(sweep_dir + 'sweep.csv', index=False)
+
+    best = RESULTS.iloc[0]
+    logging.info('best model: %i topics, %i passes (coherence %.4f, perplexity %.1f)', best['num_topics'], best['num_passes'], best['coherence'], best['perplexity'])
+    artifacts.save_model(gensim.models.ldamodel.LdaModel.load(sweep_dir + best['model_file']), sweep_dir + 'best.model')
+    return RESULTS
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build latent dirichlet allocation model')
+    parser.add_argument('--stream', action='store_true', default=lda_params['streaming'], help='stream documents from disk instead of loading the whole corpus')
+    parser.add_argument('--sweep', action='store_true', help='train a grid of topic counts and passes and keep the most coherent model')
+    parser.add_argument('--update', action='store_true', help='update the saved model with citation contexts it has not seen yet')
+    args = parser.parse_args()
+
+    if args.sweep:
+        run_sweep()
+    elif args.update:
+        update_model(read_keyed_documents())
+    else:
+        t0 = time.time()
+        if args.stream:
+            documents = iter_keyed_documents()
+        else:
+            documents = read_keyed_documents()
+        t1 = time.time()
+        if args.stream:
+            build_streamed_model(documents)
+        else:
+            build_model(documents)
+        t2 = time.time()
+        with open(lda_params['model_dir'] + 'lda_performance.info', 'w') as perf_file:
+            perf_file.write('Total time elapsed:\t\t\t\t{}\nTime spent reading documents:\t\t\t{}\nTime spent building LDA:\t\t\t{}'.format(t2-t0, t1-t0, t2-t1))
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import logging
+import sys
+import time
+import numpy as np
+import artifacts
+import lsa_model
+import token_cache
+from config import lsa_params, index_params, lsa_pipeline_config
+
+models = {}
+
+class ExactIndex(object):
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def query(self, vectors, k):
+        # embeddings are normalized, so the cosine similarity is a plain matrix product
+        scores = vectors.dot(self.embeddings.T)
+        k = min(k, scores.shape[1])
+        if k == 0:
+            return np.empty((len(vectors), 0), dtype=np.int64), np.empty((len(vectors), 0), dtype=np.float32)
+        rows = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        return rerank(rows, np.take_along_axis(scores, rows, axis=1))
+
+class LSHIndex(object):
+    # random hyperplane hashing, candidates from all tables are reranked with the exact similarity
+    def __init__(self, embeddings, num_tables=None, num_bits=None, seed=None):
+        num_tables = num_tables or index_params['num_tables']
+        num_bits = num_bits or index_params['num_bits']
+        random = np.random.RandomState(index_params['seed'] if seed is None else seed)
+        self.embeddings = embeddings
+        self.planes = random.randn(num_tables, embeddings.shape[1], num_bits).astype(np.float32)
+        self.tables = []
+        for planes in self.planes:
+            codes = self.hash(embeddings, planes)
+            order = np.argsort(codes, kind='mergesort')
+            buckets, starts = np.unique(codes[order], return_index=True)
+            self.tables.append((buckets, np.append(starts, len(order)), order))
+
+    def hash(self, vectors, planes):
+        bits = vectors.dot(planes) > 0
+        return bits.dot(1 << np.arange(planes.shape[1], dtype=np.int64))
+
+    def candidates(self, vector):
+        rows = []
+        for planes, (buckets, starts, order) in zip(self.planes, self.tables):
+            code = self.hash(vector[None, :], planes)[0]
+            position = np.searchsorted(buckets, code)
+            if position < len(buckets) and buckets[position] == code:
+                rows.append(order[starts[position]:starts[position + 1]])
+        return np.unique(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int64)
+
+    def query(self, vectors, k):
+        results_rows = np.full((len(vectors), k), -1, dtype=np.int64)
+        results_scores = np.full((len(vectors), k), -np.inf, dtype=np.float32)
+        for i, vector in enumerate(vectors):
+            rows = self.candidates(vector)
+            if len(rows) == 0:
+                continue
+            scores = self.embeddings[rows].dot(vector)
+            top = np.argsort(-scores, kind='mergesort')[:k]
+            results_rows[i, :len(top)] = rows[top]
+            results_scores[i, :len(top)] = scores[top]
+        return results_rows, results_scores
+
+def rerank(rows, scores):
+    order = np.argsort(-scores, axis=1, kind='mergesort')
+    return np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+def load_embeddings(name, side=None):
+    keys, embeddings = artifacts.load_embeddings(lsa_params['model_dir'] + name + '_embeddings')
+    if side is not None:
+        rows = (keys['side'] == side).values
+        keys = keys[rows].reset_index(drop=True)
+        embeddings = np.asarray(embeddings[rows])
+    return keys, embeddings
+
+def build_index(embeddings, method=None):
+    method = method or index_params['method']
+    if method == 'auto':
+        method = 'exact' if len(embeddings) <= index_params['max_exact_size'] else 'lsh'
+    if method == 'exact':
+        return ExactIndex(embeddings)
+    elif method == 'lsh':
+        return LSHIndex(embeddings)
+    raise ValueError('unknown index method: ' + method)
+
+def load_model(name):
+    if name not in models:
+        models[name] = lsa_model.load_model(name)
+    return models[name]
+
+def embed_texts(name, texts):
+    documents = token_cache.get_tokens(texts, lsa_model.preprocess_documents, lsa_pipeline_config())
+    return lsa_model.embed_documents(*load_model(name), documents)
+
+def query(texts, name='title', k=None, side=None, method=None):
+    k = k or index_params['k']
+    keys, embeddings = load_embeddings(name, side)
+    index = build_index(embeddings, method)
+    rows, scores = index.query(embed_texts(name, texts), k)
+    results = []
+    for i, text in enumerate(texts):
+        for rank, (row, score) in enumerate(zip(rows[i], scores[i])):
+            if row >= 0:
+                results.append(dict(query=i, rank=rank + 1, side=keys.loc[row, 'side'], citation_key=keys.loc[row, 'citation_key'], similarity=float(score)))
+    return results
+
+def benchmark(name='title', k=None, num_queries=None):
+    # corpus documents are used as queries, recall is measured against the exact top k
+    k = k or index_params['k']
+    num_queries = num_queries or index_params['benchmark_queries']
+    keys, embeddings = load_embeddings(name)
+    embeddings = np.asarray(embeddings)
+    random = np.random.RandomState(index_params['seed'])
+    queries = embeddings[random.choice(len(embeddings), min(num_queries, len(embeddings)), replace=False)]
+
+    report = dict(name=name, documents=len(embeddings), queries=len(queries), k=k)
+    exact_rows = None
+    for method in ['exact', 'lsh']:
+        t0 = time.time()
+        index = build_index(embeddings, method)
+        t1 = time.time()
+        rows, scores = index.query(queries, k)
+        t2 = time.time()
+        if method == 'exact':
+            exact_rows = rows
+        recall = np.mean([len(set(found[found >= 0]) & set(expected)) / len(expected) for found, expected in zip(rows, exact_rows)])
+        report[method] = dict(build_seconds=t1 - t0, query_ms=(t2 - t1) * 1000 / len(queries), recall=float(recall))
+        logging.info('%s index: %.3fs build, %.3fms per query, recall@%i %.3f', method, t1 - t0, report[method]['query_ms'], k, recall)
+    return report
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Query the most similar documents of the latent semantic analysis models')
+    parser.add_argument('texts', nargs='*', help='titles or abstracts to query, read line by line from stdin if omitted')
+    parser.add_argument('--name', choices=['title', 'abstract'], default='title', help='model and embeddings to query')
+    parser.add_argument('--side', choices=['lr', 'cp'], help='only return literature reviews or cited papers')
+    parser.add_argument('-k', type=int, default=index_params['k'], help='number of neighbours per query')
+    parser.add_argument('--method', choices=['auto', 'exact', 'lsh'], default=index_params['method'], help='exact matrix product or approximate hashing index')
+    parser.add_argument('--benchmark', action='store_true', help='compare recall and latency of the exact and approximate index')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.name, args.k), indent=2))
+    else:
+        texts = args.texts or [line.strip() for line in sys.stdin if line.strip()]
+        for result in query(texts, args.name, args.k, args.side, args.method):
+            print(json.dumps(result))
@@ -2,18 +2,25 @@
 # -*- coding: utf-8 -*-
 
 import pandas as pd
+import numpy as np
 import os
 import logging
 import gensim
-import pickle
+import multiprocessing as mp
 import preprocessing
+import artifacts
+import token_cache
+import vocabulary
+from config import lsa_params, lsa_pipeline_config
 
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 
-model_dir = 'models/lsa/'
+model_dir = lsa_params['model_dir']
 
 def generate_dictionary(documents):
-    return gensim.corpora.Dictionary(documents)
+    dictionary = vocabulary.create_dictionary(lsa_params, documents)
+    # per term the model holds one row of the projection matrix
+    return dictionary, vocabulary.prune_dictionary(dictionary, lsa_params, bytes_per_term=lsa_params['num_topics'] * 8)
 
 def generate_corpus(documents, dictionary):
     return [dictionary.doc2bow(doc) for doc in documents]
@@ -21,72 +28,102 @@ def generate_corpus(documents, dictionary):
 def generate_tfidf(corpus):
     return gensim.models.TfidfModel(corpus)
 
+def get_rank(dictionary, corpus):
+    # the model cannot have more useful dimensions than documents or terms
+    rank = lsa_params['rank'] if lsa_params['randomized'] else lsa_params['num_topics']
+    return max(min(rank, len(corpus), len(dictionary)), 1)
+
 def generate_lsa_model(dictionary, corpus, tfidf):
-    return gensim.models.LsiModel(tfidf[corpus], id2word=dictionary, num_topics=300)
+    if lsa_params['randomized']:
+        # multi-pass randomized truncated svd
+        return gensim.models.LsiModel(tfidf[corpus], id2word=dictionary, num_topics=get_rank(dictionary, corpus), onepass=False, power_iters=lsa_params['power_iters'], extra_samples=lsa_params['extra_samples'])
+    return gensim.models.LsiModel(tfidf[corpus], id2word=dictionary, num_topics=get_rank(dictionary, corpus))
 
-def preprocess_corpus(documents):
+def preprocess_documents(documents):
     documents = list(map(preprocessing.tokenize, documents))
     documents = [preprocessing.remove_punctuation(doc) for doc in documents]
     documents = [preprocessing.remove_numbers(doc) for doc in documents]
     documents = [preprocessing.lower(doc) for doc in documents]
     documents = [preprocessing.remove_common_stopwords(doc) for doc in documents]
     documents = [preprocessing.clean_doc(doc) for doc in documents]
-    documents = [doc for doc in documents if doc]
     return documents
 
-def generate_title_model():
-    CP = pd.read_csv('data/interim/CP.csv')
-    LR = pd.read_csv('data/interim/LR.csv')
-    documents = []
-
-    for index, row in CP.iterrows():
-        if not pd.isnull(row['title']):
-            documents.append(row['title'])
-    for index, row in LR.iterrows():
-        if not pd.isnull(row['title']):
-            documents.append(row['title'])
-
-    documents = preprocess_corpus(documents)
-    dictionary = generate_dictionary(documents)
-    corpus = generate_corpus(documents, dictionary)
-    tfidf = generate_tfidf(corpus)
-    lsa_model = generate_lsa_model(dictionary, corpus, tfidf)
-
-    dictionary.save(model_dir + 'title.dict')
-    gensim.corpora.MmCorpus.serialize(model_dir + 'title.mm', corpus)
-    lsa_model.save(model_dir + 'title.model')
-    with open(model_dir + 'title.docs', 'wb') as docs_file:
-        pickle.dump(documents, docs_file, pickle.HIGHEST_PROTOCOL)
-
-def generate_abstract_model():
-    CP = pd.read_csv('data/interim/CP.csv')
-    LR = pd.read_csv('data/interim/LR.csv')
-    LR = LR[LR['abstract'].notnull()]
-    LR = LR.loc[:,['citation_key_lr','abstract']]
-
-    documents = []
-
-    for index, row in CP.iterrows():
-        if not pd.isnull(row['abstract']):
-            documents.append(row['abstract'])
-    for index, row in LR.iterrows():
-        if not pd.isnull(row['abstract']):
-            documents.append(row['abstract'])
-
-    documents = preprocess_corpus(documents)
-    dictionary = generate_dictionary(documents)
+def read_documents():
+    CP = pd.read_csv('data/interim/CP.csv', usecols=['title', 'abstract'])
+    LR = pd.read_csv('data/interim/LR.csv', usecols=['title', 'abstract'])
+    titles = CP['title'].dropna().tolist() + LR['title'].dropna().tolist()
+    abstracts = CP['abstract'].dropna().tolist() + LR['abstract'].dropna().tolist()
+    return titles, abstracts
+
+def preprocess_parallel(documents):
+    chunksize = max(len(documents) // lsa_params['workers'], 1)
+    chunks = [documents[i:i + chunksize] for i in range(0, len(documents), chunksize)]
+    pool = mp.Pool(lsa_params['workers'])
+    results = pool.map(preprocess_documents, chunks)
+    pool.close()
+    pool.join()
+    return [doc for chunk in results for doc in chunk]
+
+def preprocess_shared(titles, abstracts):
+    # one cached, parallel preprocessing pass over the titles and abstracts of both models
+    documents = token_cache.get_tokens(titles + abstracts, preprocess_parallel, lsa_pipeline_config())
+    n = len(titles)
+    titles = [doc for doc in documents[:n] if doc]
+    abstracts = [doc for doc in documents[n:] if doc]
+    return titles, abstracts
+
+def generate_model(name, documents):
+    dictionary, vocabulary_report = generate_dictionary(documents)
     corpus = generate_corpus(documents, dictionary)
     tfidf = generate_tfidf(corpus)
     lsa_model = generate_lsa_model(dictionary, corpus, tfidf)
 
-    dictionary.save(model_dir + 'abstract.dict')
-    gensim.corpora.MmCorpus.serialize(model_dir + 'abstract.mm', corpus)
-    lsa_model.save(model_dir + 'abstract.model')
-    with open(model_dir + 'abstract.docs', 'wb') as docs_file:
-        pickle.dump(documents, docs_file, pickle.HIGHEST_PROTOCOL)
+    dictionary.save(model_dir + name + '.dict')
+    vocabulary.save_report(vocabulary_report, model_dir + name + '_vocabulary.json')
+    gensim.corpora.MmCorpus.serialize(model_dir + name + '.mm', corpus)
+    artifacts.save_model(lsa_model, model_dir + name + '.model')
+    artifacts.save_docs(model_dir + name + '.docs', documents)
+
+def generate_models():
+    titles, abstracts = read_documents()
+    titles, abstracts = preprocess_shared(titles, abstracts)
+    pool = mp.Pool(2)
+    pool.starmap(generate_model, [('title', titles), ('abstract', abstracts)])
+    pool.close()
+    pool.join()
+
+def load_model(name):
+    dictionary = gensim.corpora.Dictionary.load(model_dir + name + '.dict')
+    lsa_model = artifacts.load_model(gensim.models.LsiModel, model_dir + name + '.model')
+    return dictionary, lsa_model
+
+def embed_documents(dictionary, lsa_model, documents):
+    corpus = [dictionary.doc2bow(doc) for doc in documents]
+    embeddings = gensim.matutils.corpus2dense(lsa_model[corpus], num_terms=lsa_model.num_topics, num_docs=len(corpus)).T
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    # documents without any known term keep a zero row and get a similarity of 0
+    return np.divide(embeddings, norms, out=np.zeros_like(embeddings), where=norms > 0)
+
+def read_keyed_documents():
+    LR = pd.read_csv('data/interim/LR.csv', usecols=['citation_key_lr', 'title', 'abstract'])
+    LR = LR.rename(columns={'citation_key_lr': 'citation_key'}).assign(side='lr')
+    CP = pd.read_csv('data/interim/CP.csv', usecols=['citation_key_cp', 'title', 'abstract'])
+    CP = CP.rename(columns={'citation_key_cp': 'citation_key'}).assign(side='cp')
+    documents = pd.concat([LR, CP], ignore_index=True, sort=False)
+    return documents.drop_duplicates(['side', 'citation_key']).reset_index(drop=True)
+
+def generate_embeddings():
+    documents = read_keyed_documents()
+    for name in ['title', 'abstract']:
+        texts = documents[name].dropna().astype(str)
+        tokens = [[] for _ in range(len(documents))]
+        for index, doc in zip(texts.index, token_cache.get_tokens(texts.tolist(), preprocess_documents, lsa_pipeline_config())):
+            tokens[index] = doc
+        embeddings = embed_documents(*load_model(name), tokens)
+        artifacts.save_embeddings(model_dir + name + '_embeddings', documents[['side', 'citation_key']], embeddings)
 
 if __name__ == '__main__':
     if not os.path.exists(model_dir):
         os.makedirs(model_dir)
-    generate_title_model()
-    generate_abstract_model()
+    generate_models()
+    generate_embeddings()
@@ -4,14 +4,17 @@
 from nltk.corpus import stopwords
 from nltk.stem.wordnet import WordNetLemmatizer
 from nltk import bigrams,trigrams
-from nltk import pos_tag
+from nltk import pos_tag, pos_tag_sents
 from nltk import word_tokenize
 import string
+from config import custom_stopwords_file
 
 stop = set(stopwords.words('english'))
 punctuation = set(string.punctuation + '–')
 numbers = set(string.digits)
 lemma = WordNetLemmatizer()
+# surface form -> lemma, filled lazily by lemmatize_word
+lemmas = {}
 
 def tokenize(sentence):
     return word_tokenize(sentence)
@@ -25,6 +28,12 @@ def get_pos_tags(doc):
 def filter_pos_tags(doc, tags=('NN', 'VB', 'JJ', 'RB')):
     return [i[0] for i in get_pos_tags(doc) if i[1].startswith(tags)]
 
+def get_corpus_pos_tags(docs):
+    return pos_tag_sents(docs)
+
+def filter_corpus_pos_tags(docs, tags=('NN', 'VB', 'JJ', 'RB')):
+    return [[i[0] for i in doc if i[1].startswith(tags)] for doc in get_corpus_pos_tags(docs)]
+
 def get_bigrams(doc):
     bigram_list = []
     for bigram in bigrams(doc):
@@ -41,7 +50,7 @@ def remove_common_stopwords(doc):
     return [i for i in doc if i not in stop]
 
 def remove_custom_stopwords(doc):
-    with open('data/raw/custom_stopwords.txt', 'r') as f:
+    with open(custom_stopwords_file, 'r') as f:
         custom_stopwords = f.read().splitlines()
         return [i for i in doc if i not in custom_stopwords]
 
@@ -57,8 +66,18 @@ def filter_pos(doc, filter):
 def filter_n_grams(doc, filter):
     return [ngram for ngram in doc if set(ngram.split('_')) < set(filter)]
 
+def lemmatize_word(word):
+    try:
+        return lemmas[word]
+    except KeyError:
+        lemmas[word] = lemma.lemmatize(word)
+        return lemmas[word]
+
 def lemmatize(doc):
-    return [lemma.lemmatize(word) for word in doc]
+    return [lemmatize_word(word) for word in doc]
+
+def lemmatize_corpus(docs):
+    return [lemmatize(doc) for doc in docs]
 
 def validate_markers(sentence):
     sentence = sentence.split('CITATION')
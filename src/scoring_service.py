@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import numpy as np
+import pandas as pd
+import authors
+import citation_extraction
+import classifier
+import cp_metadata_extraction
+import feature_frame
+import features
+import lr_cp_metadata_extraction
+import lsa_index
+import storage
+import tei_tools
+from config import service_params
+
+# everything the scorer needs between requests, filled once by warm_up
+context = {}
+
+def warm_up():
+    t0 = time.time()
+    ARTICLE = pd.read_csv(citation_extraction.data_dir + 'ARTICLE.csv')
+    citation_extraction.ARTICLE = ARTICLE
+    context['ARTICLE'] = ARTICLE.drop_duplicates('citation_key').set_index('citation_key')
+    context['author_index'] = authors.build_author_index(ARTICLE)
+    context['LR'] = pd.read_csv('data/interim/LR.csv', usecols=['citation_key_lr', 'SYN', 'TT', 'TB', 'RG', 'CRI', 'RA'])
+    context['selected_features'] = features.select_features()
+    if 'sentence_sentiment' in context['selected_features'] or 'context_sentiment' in context['selected_features']:
+        citation_extraction.get_sentiment('')
+    for name in ['title', 'abstract']:
+        lr_cp_metadata_extraction.load_embeddings(name)
+        lsa_index.load_model(name)
+    feature_frame.load_topic_model()
+    context['model'] = classifier.load_model() if classifier.has_model() else None
+    logging.info('scoring service ready in %.1fs, classifier %s', time.time() - t0, 'loaded' if context['model'] else 'not trained')
+
+def timed(timings, stage, function, *args):
+    t0 = time.time()
+    result = function(*args)
+    timings[stage] = (time.time() - t0) * 1000
+    return result
+
+def get_article(citation_key, column, default=''):
+    if citation_key in context['ARTICLE'].index and pd.notnull(context['ARTICLE'].loc[citation_key, column]):
+        return context['ARTICLE'].loc[citation_key, column]
+    return default
+
+def get_cp_surnames(citation_key_cp, root):
+    # papers missing from ARTICLE are matched on the authors of the tei header
+    if citation_key_cp in context['author_index'].index:
+        return context['author_index'][citation_key_cp]
+    header = root.find('.//' + tei_tools.ns['tei'] + 'sourceDesc/' + tei_tools.ns['tei'] + 'biblStruct')
+    if header is None:
+        return frozenset()
+    names = tei_tools.read_bibl_struct(header).authors.split(';')
+    return frozenset(authors.normalize(name.split(',')[0]) for name in names if name.strip())
+
+def get_similarity(name, citation_key_lr, text):
+    keys, embeddings = lr_cp_metadata_extraction.load_embeddings(name)
+    row = lr_cp_metadata_extraction.get_embedding_rows(keys, 'lr', pd.Series([citation_key_lr]))[0]
+    if pd.isnull(row):
+        return np.nan
+    return float(lsa_index.embed_texts(name, [text])[0].dot(embeddings[int(row)]))
+
+def get_pair_metadata(citation_key_lr, citation_key_cp, root, abstract):
+    title_cp = get_article(citation_key_cp, 'title', tei_tools.get_paper_title(root))
+    lr_surnames = context['author_index'].get(citation_key_lr, frozenset())
+    LR_CP = pd.DataFrame(dict(citation_key_lr=[citation_key_lr],
+                              citation_key_cp=[citation_key_cp],
+                              self_citation=[bool(lr_surnames & get_cp_surnames(citation_key_cp, root))],
+                              title_similarity=[get_similarity('title', citation_key_lr, title_cp)],
+                              abstract_similarity=[get_similarity('abstract', citation_key_lr, abstract)],
+                              ref_in_title=[lr_cp_metadata_extraction.check_ref_in_title(tei_tools.get_paper_title(root), authors.surnames(get_article(citation_key_lr, 'author', None)))]))
+    # a new pair is not coded, NOT only has to be present for the USE label of the feature frame
+    for column in storage.coding_columns:
+        LR_CP[column] = False
+    return storage.apply_schema(LR_CP, 'LR_CP')
+
+def get_citations(citation_key_lr, citation_key_cp, path):
+    row = pd.Series(dict(citation_key_lr=citation_key_lr,
+                         citation_key_cp=citation_key_cp,
+                         title_lr=get_article(citation_key_lr, 'title'),
+                         author_lr=get_article(citation_key_lr, 'author'),
+                         year_lr=get_article(citation_key_lr, 'year'),
+                         journal_cp=get_article(citation_key_cp, 'journal')))
+    CITATION = citation_extraction.parse_citation(row, context['selected_features'], path)
+    CITATION = CITATION[[column for column in feature_frame.citation_columns if column in CITATION]]
+    return storage.apply_schema(CITATION, 'CITATION')
+
+def to_json(value):
+    if isinstance(value, (np.bool_, bool)):
+        return bool(value)
+    if isinstance(value, (np.integer, int)):
+        return int(value)
+    if isinstance(value, (np.floating, float)):
+        return None if np.isnan(value) else float(value)
+    return str(value)
+
+def get_tei_path(path):
+    # the service runs on client input, so it only parses files of the tei directory
+    tei_dir = os.path.realpath(service_params['tei_dir'])
+    if not isinstance(path, str) or os.path.commonpath([tei_dir, os.path.realpath(path)]) != tei_dir:
+        raise ValueError('tei must be a file in ' + service_params['tei_dir'])
+    return path
+
+def score(request):
+    timings = collections.OrderedDict()
+    t0 = time.time()
+    if not isinstance(request, dict):
+        raise ValueError('request must be a json object')
+    path = get_tei_path(request['tei'])
+    citation_key_lr = request['lr']
+    citation_key_cp = request.get('cp') or os.path.basename(path).split('.tei.xml')[0]
+    response = collections.OrderedDict([('lr', citation_key_lr), ('cp', citation_key_cp)])
+    try:
+        if citation_key_lr not in context['ARTICLE'].index or not (context['LR']['citation_key_lr'] == citation_key_lr).any():
+            raise ValueError('unknown literature review: ' + citation_key_lr)
+        root = timed(timings, 'parse', lambda: tei_tools.parse(path).getroot())
+        total_references, total_citations, abstract = timed(timings, 'statistics', cp_metadata_extraction.extract_statistics, path)
+        CITATION = timed(timings, 'citations', get_citations, citation_key_lr, citation_key_cp, path)
+        response['citations'] = int(CITATION['citation_sentence'].notnull().sum())
+        if response['citations'] == 0:
+            raise ValueError('no citation of the literature review found')
+        LR_CP = timed(timings, 'similarity', get_pair_metadata, citation_key_lr, citation_key_cp, root, abstract)
+        LR = context['LR'][context['LR']['citation_key_lr'] == citation_key_lr]
+        CP = pd.DataFrame(dict(citation_key_cp=[citation_key_cp], total_references=[total_references], total_citations=[total_citations]))
+        FEATURE_FRAME = timed(timings, 'features', feature_frame.build_feature_frame, CITATION, LR_CP, LR, CP)
+        FEATURES = FEATURE_FRAME.drop(columns=[column for column in ['USE'] + storage.coding_columns if column in FEATURE_FRAME])
+        response['features'] = collections.OrderedDict((column, to_json(value)) for column, value in FEATURES.iloc[0].items())
+        if context['model'] is not None:
+            PREDICTIONS = timed(timings, 'classification', classifier.predict, FEATURE_FRAME, context['model'])
+            response['classification'] = dict(USE_probability=to_json(PREDICTIONS['USE_probability'].iloc[0]),
+                                              USE_predicted=to_json(PREDICTIONS['USE_predicted'].iloc[0]))
+        else:
+            response['classification'] = None
+    except Exception as e:
+        logging.exception('scoring %s / %s failed', citation_key_lr, citation_key_cp)
+        response['error'] = str(e)
+    timings['total'] = (time.time() - t0) * 1000
+    response['latency_ms'] = collections.OrderedDict((stage, round(ms, 3)) for stage, ms in timings.items())
+    logging.info('scored %s / %s in %.1f ms', citation_key_lr, citation_key_cp, timings['total'])
+    return response
+
+def serve_stdin():
+    # one json request per line in, one json response per line out
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            response = score(json.loads(line))
+        except (ValueError, KeyError, TypeError) as e:
+            response = dict(error='invalid request: ' + str(e))
+        sys.stdout.write(json.dumps(response) + '\n')
+        sys.stdout.flush()
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        try:
+            response = score(json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')))
+            status = 200 if 'error' not in response else 422
+        except (ValueError, KeyError, TypeError) as e:
+            response = dict(error='invalid request: ' + str(e))
+            status = 400
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.info('%s - ' + format, self.address_string(), *args)
+
+def serve_http(host, port):
+    server = HTTPServer((host, port), ScoringHandler)
+    logging.info('listening on http://%s:%i', host, port)
+    server.serve_forever()
+
+if __name__ == '__main__':
+    # logs go to stderr, stdout only carries responses
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO, stream=sys.stderr)
+    parser = argparse.ArgumentParser(description='Score citing papers against literature reviews with all models kept in memory')
+    parser.add_argument('--http', action='store_true', help='serve POST requests over http instead of json lines on stdin')
+    parser.add_argument('--host', default=service_params['host'], help='http host to bind')
+    parser.add_argument('--port', type=int, default=service_params['port'], help='http port to bind')
+    args = parser.parse_args()
+
+    warm_up()
+    if args.http:
+        serve_http(args.host, args.port)
+    else:
+        serve_stdin()
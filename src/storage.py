@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import csv
+import os
+import shutil
+import urllib.parse
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from config import storage_params
+
+keys = ['citation_key_lr', 'citation_key_cp']
+
+coding_columns = ['NOT', 'SYN_TB', 'CRI_ADDR', 'RG_SYN', 'RG_CLOSE', 'RA_CLOSE', 'TB_TB', 'TB_TT', 'TB_RG', 'TT_TT', 'TT_RG']
+
+count_columns = (['focal_citations', 'textual', 'separate', 'comp_sup', 'prp'] +
+                 ['pos_' + str(i) for i in range(6)] +
+                 ['ref_in_heading', 'ref_in_figure_description', 'ref_in_table_description', 'total_references', 'total_citations'] +
+                 ['mention_positions_' + str(position) for position in range(10, 101, 10)] +
+                 ['heading_category_' + category for category in ['NA', 'intro', 'background', 'theory', 'methods', 'results', 'implications', 'appendix']])
+
+# column -> dtype, columns missing from a schema get its default dtype
+# bool flags are stored without missing values (False), nullable numbers as float with NaN
+schemas = dict(
+    CITATION = dict(
+        columns = dict([(key, 'category') for key in keys] +
+                       [(column, 'str') for column in ['citation_sentence', 'predecessor', 'successor', 'pos_pattern', 'heading_title']] +
+                       [(column, 'bool') for column in ['textual', 'separate', 'comp_sup', 'prp', 'pos_0', 'pos_1', 'pos_2', 'pos_3', 'pos_4', 'pos_5', 'ref_in_figure_description', 'ref_in_table_description', 'ref_in_heading']] +
+                       [('heading_category', 'category'),
+                        # binned by percent, float32 rounding would move positions across bin edges
+                        ('position_in_document', 'float64')]),
+        default = 'float32'
+    ),
+    LR_CP = dict(
+        columns = dict([(key, 'category') for key in keys] +
+                       [(column, 'bool') for column in ['self_citation', 'ref_in_title'] + coding_columns]),
+        default = 'float32'
+    ),
+    FEATURE_FRAME = dict(
+        columns = dict([(key, 'category') for key in keys] +
+                       [(column, 'int32') for column in count_columns] +
+                       [(column, 'bool') for column in ['self_citation', 'ref_in_title', 'SYN', 'TT', 'TB', 'RG', 'CRI', 'RA', 'USE'] + coding_columns]),
+        default = 'float32'
+    ),
+    FEATURE_HASHES = dict(
+        columns = dict([(key, 'category') for key in keys] + [('input_hash', 'uint64')]),
+        default = 'float32'
+    )
+)
+
+paths = dict(
+    CITATION = 'data/interim/CITATION.parquet',
+    LR_CP = 'data/interim/LR_CP.parquet',
+    FEATURE_FRAME = 'data/processed/FEATURE_FRAME.parquet',
+    FEATURE_HASHES = 'data/processed/FEATURE_HASHES.parquet',
+    # prefix of the .npy feature matrix, label vector, keys and column metadata
+    FEATURE_MATRIX = 'data/processed/FEATURE_MATRIX'
+)
+
+def to_bool(column):
+    # csv round trips and '' placeholders leave flags as strings or missing values
+    return column.map({True: True, False: False, 'True': True, 'False': False}).fillna(False).astype(bool)
+
+def cast_column(column, dtype):
+    if dtype == 'category':
+        return column.astype('category')
+    elif dtype == 'str':
+        return column.where(column.notnull() & (column != ''), None).astype(object)
+    elif dtype == 'bool':
+        return to_bool(column)
+    elif dtype.startswith('int'):
+        return pd.to_numeric(column, errors='coerce').fillna(0).astype(dtype)
+    return pd.to_numeric(column, errors='coerce').astype(dtype)
+
+def apply_schema(df, table):
+    schema = schemas[table]
+    df = df.copy()
+    for column in df.columns:
+        df[column] = cast_column(df[column], schema['columns'].get(column, schema['default']))
+    return df
+
+def remove_table(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def write_table(df, table, path=None, partition=None):
+    path = path or paths[table]
+    partition = storage_params['partition'] if partition is None else partition
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    df = apply_schema(df, table).reset_index(drop=True)
+    # pyarrow adds files to an existing partitioned dataset, so the table is written aside and swapped in whole
+    staging = path + '.tmp'
+    remove_table(staging)
+    if partition:
+        # one directory per review, readers can skip whole reviews
+        df.to_parquet(staging, engine='pyarrow', index=False, partition_cols=['citation_key_lr'], row_group_size=storage_params['row_group_size'])
+    else:
+        df.to_parquet(staging, engine='pyarrow', index=False, row_group_size=storage_params['row_group_size'])
+    remove_table(path)
+    os.rename(staging, path)
+
+def read_table(table, columns=None, path=None):
+    # only the requested columns are read from disk
+    df = pd.read_parquet(path or paths[table], engine='pyarrow', columns=columns)
+    return apply_schema(df, table)
+
+def table_files(path):
+    # (file, partition values) in sorted order, a partitioned table keeps its partition values in the directory names
+    if not os.path.isdir(path):
+        yield path, {}
+        return
+    for directory, subdirectories, files in os.walk(path):
+        subdirectories.sort()
+        partitions = dict(urllib.parse.unquote(name).split('=', 1) for name in os.path.relpath(directory, path).split(os.sep) if '=' in name)
+        for name in sorted(files):
+            if name.endswith('.parquet'):
+                yield os.path.join(directory, name), partitions
+
+def iter_row_groups(table, columns=None, path=None):
+    # one row group at a time, memory is bounded by the row group size rather than the table
+    for file_path, partitions in table_files(path or paths[table]):
+        parquet_file = pq.ParquetFile(file_path)
+        file_columns = None if columns is None else [column for column in columns if column not in partitions]
+        for i in range(parquet_file.num_row_groups):
+            df = parquet_file.read_row_group(i, columns=file_columns).to_pandas()
+            for column, value in partitions.items():
+                if columns is None or column in columns:
+                    df[column] = value
+            yield apply_schema(df[columns] if columns is not None else df, table)
+
+def table_columns(table, path=None):
+    return pq.ParquetDataset(path or paths[table]).schema.names
+
+def feature_matrix(df, columns):
+    # contiguous float32 matrix of the given columns, columns missing from df are left as NaN
+    features = np.full((len(df), len(columns)), np.nan, dtype=np.float32)
+    for i, column in enumerate(columns):
+        if column in df:
+            features[:, i] = df[column].values.astype(np.float32)
+    return features
+
+def export_csv(df, path):
+    df.to_csv(path, index=False, quoting=csv.QUOTE_ALL)
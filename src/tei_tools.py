@@ -2,11 +2,42 @@
 # -*- coding: utf-8 -*-
 
 from lxml import etree
+import functools
+import os
 import re
 import pandas as pd
 from fuzzywuzzy import fuzz
 
 ns = {'tei': '{http://www.tei-c.org/ns/1.0}', 'w3': '{http://www.w3.org/XML/1998/namespace}'}
+nsmap = {'tei': 'http://www.tei-c.org/ns/1.0', 'w3': 'http://www.w3.org/XML/1998/namespace'}
+
+parser = etree.XMLParser(huge_tree=True, remove_comments=True)
+
+xpath_analytic = etree.XPath('tei:analytic[1]', namespaces=nsmap)
+xpath_monogr = etree.XPath('tei:monogr[1]', namespaces=nsmap)
+xpath_authors = etree.XPath('tei:author', namespaces=nsmap)
+xpath_surname = etree.XPath('tei:persName[1]/tei:surname[1]', namespaces=nsmap)
+xpath_forename = etree.XPath('tei:persName[1]/tei:forename[1]', namespaces=nsmap)
+xpath_editor = etree.XPath('tei:editor[1]', namespaces=nsmap)
+xpath_org_name = etree.XPath('tei:orgName[1]', namespaces=nsmap)
+xpath_title = etree.XPath('tei:title[1]', namespaces=nsmap)
+xpath_date = etree.XPath('tei:imprint[1]/tei:date[1]', namespaces=nsmap)
+
+abbreviations_file = 'data/raw/JOURNAL_ABBREVIATIONS.csv'
+# normalized abbreviation or journal name -> normalized journal name, loaded on first use
+journal_abbreviations = None
+
+# applied in order to lower case titles before matching
+title_replacements = [('information technology', 'it'), ('information systems', 'is'), ('resource-based view', 'rbv'), (r'^review', ''), (r'[^A-Za-z0-9, ]+', '')]
+
+def parse(source):
+    return etree.parse(source, parser)
+
+def iterparse(source, events=('end',)):
+    return etree.iterparse(source, events=events, huge_tree=True, remove_comments=True)
+
+def fromstring(text):
+    return etree.fromstring(text, parser)
 
 def paper_alphanumeric_citation_style(root):
     alphanumeric_references = []
@@ -28,8 +59,9 @@ def paper_alphanumeric_citation_style(root):
         return False
 
 def extract_abstract(root):
-    abstract = root.find('.//' + ns['tei'] + 'abstract')
+    return abstract_text(root.find('.//' + ns['tei'] + 'abstract'))
 
+def abstract_text(abstract):
     if abstract is None:
         return None
     else:
@@ -51,25 +83,23 @@ def get_reference_id(root, REFERENCE):
 
     BIBLIOGRAPHY = pd.DataFrame(columns = ['reference_id', 'author', 'title', 'year', 'journal', 'similarity'])
 
+    entries = [BIBLIOGRAPHY]
     bibliographies = root.iter(ns['tei'] + 'listBibl')
     for bibliography in bibliographies:
         for reference in bibliography:
+            record = read_bibl_struct(reference)
 
-            reference_id = get_reference_bibliography_id(reference)
-            title_string = get_reference_title_string(reference)
-            author_string = get_reference_author_string(reference)
-            year_string = get_reference_year_string(reference)
-            journal_string = get_reference_journal_string(reference)
-
-            if(title_string is None and journal_string and len(journal_string) > 0):
-                title_string = journal_string
+            title_string = record.title
+            if(title_string is None and record.journal and len(record.journal) > 0):
+                title_string = record.journal
 
             if title_string is not None:
-                ENTRY = pd.DataFrame.from_records([[reference_id, author_string, title_string, year_string, journal_string, 0]], columns = ['reference_id', 'author', 'title', 'year', 'journal', 'similarity'])
+                ENTRY = pd.DataFrame.from_records([[record.id, record.authors, title_string, record.year, record.journal, 0.0]], columns = ['reference_id', 'author', 'title', 'year', 'journal', 'similarity'])
 
                 ENTRY.loc[0, 'similarity'] = get_similarity(ENTRY, REFERENCE)
-                BIBLIOGRAPHY = BIBLIOGRAPHY.append(ENTRY)
+                entries.append(ENTRY)
 
+    BIBLIOGRAPHY = pd.concat(entries, sort=False)
     BIBLIOGRAPHY = BIBLIOGRAPHY.reset_index(drop=True)
     if BIBLIOGRAPHY.shape[0] == 0:
         return 'no_bibliography'
@@ -83,27 +113,22 @@ def get_reference_id(root, REFERENCE):
 def get_similarity(df_a, df_b):
     # df_a:= extracted from PDF
     # df_b:= literature review
-    authors_a = re.sub(r'[^A-Za-z0-9, ]+', '', str(df_a['authors']).lower())
-    authors_b = re.sub(r'[^A-Za-z0-9, ]+', '', str(df_b['authors']).lower())
+    # single-row frames, compared on the strings of their first row
+    authors_a = re.sub(r'[^A-Za-z0-9, ]+', '', get_field(df_a, 'author').lower())
+    authors_b = re.sub(r'[^A-Za-z0-9, ]+', '', get_field(df_b, 'author').lower())
     author_similarity = fuzz.ratio(authors_a, authors_b)/100
 
     #partial ratio (catching 2010-10 or 2001-2002)
-    year_similarity = fuzz.partial_ratio(str(df_a['year']), str(df_b['year']))/100
+    year_similarity = fuzz.partial_ratio(get_field(df_a, 'year'), get_field(df_b, 'year'))/100
 
-    journal_a = re.sub(r'[^A-Za-z0-9 ]+', '', str(df_a['journal']).lower())
-    journal_b = re.sub(r'[^A-Za-z0-9 ]+', '', str(df_b['journal']).lower())
-    
     # replacing abbreviations before matching and matching lower cases (catching different citation styles)
-    # for i, row in JOURNAL_ABBREVIATIONS.iterrows():
-    #     if journal_a == row['abbreviation']:
-    #         journal_a = row['journal']
-    #     if journal_b == row['abbreviation']:
-    #         journal_b = row['journal']
+    journal_a = normalize_journal(get_field(df_a, 'journal'))
+    journal_b = normalize_journal(get_field(df_b, 'journal'))
     journal_similarity = fuzz.ratio(journal_a, journal_b)/100
 
-    title_a = df_a['title'].str.lower().replace(regex={'information technology':'it', 'information systems':'is', 'resource-based view':'rbv', r'^review':'', r'[^A-Za-z0-9, ]+':''})
-    title_b = df_b['title'].str.lower().replace(regex={'information technology':'it', 'information systems':'is', 'resource-based view':'rbv', r'^review':'', r'[^A-Za-z0-9, ]+':''})
-    
+    title_a = normalize_title(get_field(df_a, 'title'))
+    title_b = normalize_title(get_field(df_b, 'title'))
+
     # titles are sometimes (errorneously) in the journal-fields...
     title_similarity = max(fuzz.ratio(title_a, title_b)/100, fuzz.ratio(journal_a, title_b)/100)
     if fuzz.ratio(journal_a, title_b)/100 > 0.9:
@@ -115,6 +140,40 @@ def get_similarity(df_a, df_b):
 
     return weighted_average
 
+def normalize_title(title):
+    title = title.lower()
+    for pattern, replacement in title_replacements:
+        title = re.sub(pattern, replacement, title)
+    return title
+
+def get_field(df, column):
+    if df.shape[0] == 0 or pd.isnull(df[column].iloc[0]):
+        return ''
+    return str(df[column].iloc[0])
+
+def clean_journal(journal):
+    journal = ' '.join(re.sub(r'[^A-Za-z0-9 ]+', '', journal.lower()).split())
+    if journal.startswith('the '):
+        journal = journal[4:]
+    return journal
+
+def load_journal_abbreviations():
+    global journal_abbreviations
+    if journal_abbreviations is None:
+        journal_abbreviations = {}
+        if os.path.exists(abbreviations_file):
+            JOURNAL_ABBREVIATIONS = pd.read_csv(abbreviations_file)
+            for abbreviation, journal in zip(JOURNAL_ABBREVIATIONS['abbreviation'], JOURNAL_ABBREVIATIONS['journal']):
+                journal = clean_journal(journal)
+                journal_abbreviations[clean_journal(abbreviation)] = journal
+                journal_abbreviations[journal] = journal
+    return journal_abbreviations
+
+@functools.lru_cache(maxsize=None)
+def normalize_journal(journal):
+    journal = clean_journal(journal)
+    return load_journal_abbreviations().get(journal, journal)
+
 
 # paper metadata -----------------------------------------------
 
@@ -129,6 +188,72 @@ def get_paper_title(root):
 
 # (individual) bibliography-reference elements  --------------------------------------------------------------------------------------
 
+class BiblStruct(object):
+    __slots__ = ('id', 'authors', 'title', 'year', 'journal')
+
+    def __init__(self, id, authors, title, year, journal):
+        self.id = id
+        self.authors = authors
+        self.title = title
+        self.year = year
+        self.journal = journal
+
+    def __repr__(self):
+        return 'BiblStruct({!r}, {!r}, {!r}, {!r}, {!r})'.format(self.id, self.authors, self.title, self.year, self.journal)
+
+def first(nodes):
+    return nodes[0] if nodes else None
+
+def node_text(node):
+    if node is None or node.text is None:
+        return ''
+    return node.text
+
+def read_bibl_struct(reference):
+    # single pass over a biblStruct, equivalent to the get_reference_*_string functions below
+    analytic = first(xpath_analytic(reference))
+    monogr = first(xpath_monogr(reference))
+    title_node = analytic if analytic is not None else monogr
+    date_node = monogr if monogr is not None else analytic
+
+    author_list = []
+    if title_node is not None:
+        for author in xpath_authors(title_node):
+            surname = node_text(first(xpath_surname(author)))
+            forename = node_text(first(xpath_forename(author)))
+            #check surname and prename len. and swap
+            if(len(surname) < len(forename)):
+                author_list.append(forename + ', ' + surname)
+            else:
+                author_list.append(surname + ', ' + forename)
+
+    #fill author field with editor or organization if null
+    if len(author_list) == 0:
+        substitute = first(xpath_editor(reference))
+        if substitute is None:
+            substitute = first(xpath_org_name(reference))
+        if substitute is not None:
+            author_list.append(substitute.text)
+    author_string = ';'.join(author_list).replace('\n', ' ').replace('\r', '')
+
+    title = first(xpath_title(title_node)) if title_node is not None else None
+    title_string = 'NA' if title is None else title.text
+
+    year_string = 'NA'
+    date = first(xpath_date(date_node)) if date_node is not None else None
+    if date is not None:
+        attributes = sorted(date.items())
+        if not attributes:
+            year_string = ''
+        elif attributes[-1][0] == 'when':
+            year_string = attributes[-1][1]
+
+    journal_string = ''
+    if monogr is not None:
+        journal_string = node_text(first(xpath_title(monogr)))
+
+    return BiblStruct(reference.get(ns['w3'] + 'id'), author_string, title_string, year_string, journal_string)
+
 
 def get_reference_author_string(reference):
     author_list = []
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import time
+
+from config import cache_params
+
+# sqlite limits the number of host parameters per statement
+chunk_size = 500
+
+def hash_text(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def hash_config(config):
+    return hashlib.sha1(repr(sorted(config.items())).encode('utf-8')).hexdigest()
+
+def connect(cache_file=None):
+    cache_file = cache_file or cache_params['cache_file']
+    cache_dir = os.path.dirname(cache_file)
+    if cache_dir and not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    connection = sqlite3.connect(cache_file)
+    connection.execute('CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, tokens BLOB, size INTEGER, accessed REAL)')
+    connection.execute('CREATE INDEX IF NOT EXISTS tokens_accessed ON tokens (accessed)')
+    return connection
+
+def chunks(items):
+    for i in range(0, len(items), chunk_size):
+        yield items[i:i + chunk_size]
+
+def lookup(connection, keys):
+    found = {}
+    for chunk in chunks(keys):
+        query = 'SELECT key, tokens FROM tokens WHERE key IN ({})'.format(','.join('?' * len(chunk)))
+        for key, tokens in connection.execute(query, chunk):
+            found[key] = pickle.loads(tokens)
+    now = time.time()
+    for chunk in chunks(list(found)):
+        connection.execute('UPDATE tokens SET accessed = ? WHERE key IN ({})'.format(','.join('?' * len(chunk))), [now] + chunk)
+    return found
+
+def store(connection, entries):
+    now = time.time()
+    rows = []
+    for key, tokens in entries.items():
+        blob = pickle.dumps(tokens, pickle.HIGHEST_PROTOCOL)
+        rows.append((key, blob, len(blob), now))
+    connection.executemany('INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?)', rows)
+
+def evict(connection, max_size=None):
+    max_size = max_size or cache_params['max_size']
+    total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM tokens').fetchone()[0]
+    if total_size <= max_size:
+        return 0
+    # drop least recently used entries until the cache fits again
+    evicted = []
+    for key, size in connection.execute('SELECT key, size FROM tokens ORDER BY accessed'):
+        if total_size <= max_size:
+            break
+        evicted.append(key)
+        total_size -= size
+    for chunk in chunks(evicted):
+        connection.execute('DELETE FROM tokens WHERE key IN ({})'.format(','.join('?' * len(chunk))), chunk)
+    return len(evicted)
+
+def get_tokens(documents, preprocess, config, cache_file=None):
+    # preprocess maps a list of texts to a list of token lists and is only called for cache misses
+    documents = list(documents)
+    config_hash = hash_config(config)
+    keys = [hash_text(doc) + config_hash for doc in documents]
+
+    connection = connect(cache_file)
+    try:
+        found = lookup(connection, list(set(keys)))
+        missing = {}
+        for key, doc in zip(keys, documents):
+            if key not in found and key not in missing:
+                missing[key] = doc
+        if missing:
+            computed = dict(zip(missing.keys(), preprocess(list(missing.values()))))
+            store(connection, computed)
+            found.update(computed)
+        evicted = evict(connection)
+        connection.commit()
+    finally:
+        connection.close()
+
+    logging.info('token cache: %i documents, %i hits, %i preprocessed, %i evicted', len(documents), len(documents) - len(missing), len(missing), evicted)
+    return [found[key] for key in keys]
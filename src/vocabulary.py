@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import gensim
+import json
+import logging
+import sys
+
+def create_dictionary(params, documents=None):
+    if params['hashing']:
+        return gensim.corpora.HashDictionary(documents, id_range=params['id_range'])
+    return gensim.corpora.Dictionary(documents)
+
+def is_hashing(dictionary):
+    return isinstance(dictionary, gensim.corpora.HashDictionary)
+
+def count_terms(dictionary):
+    # distinct terms seen for a hashing dictionary, distinct ids otherwise
+    if is_hashing(dictionary):
+        return len(dictionary.dfs_debug)
+    return len(dictionary)
+
+def count_oov(dictionary, documents):
+    if is_hashing(dictionary):
+        return 0
+    return sum(1 for doc in documents for token in doc if token not in dictionary.token2id)
+
+def prune_dictionary(dictionary, params, bytes_per_term=0):
+    # bytes_per_term: size of the model parameters that grow with every vocabulary entry
+    terms_before = count_terms(dictionary)
+    ids_before = len(dictionary)
+    tokens_before = set() if is_hashing(dictionary) else set(dictionary.token2id)
+
+    dictionary.filter_extremes(no_below=params['no_below'], no_above=params['no_above'], keep_n=params['keep_n'])
+
+    ids_after = len(dictionary)
+    if is_hashing(dictionary):
+        # the model allocates the whole id range, compared against an unbounded dictionary
+        ids_before = terms_before
+        ids_after = params['id_range']
+        token_bytes_saved = 0
+    else:
+        token_bytes_saved = sum(sys.getsizeof(token) for token in tokens_before - set(dictionary.token2id))
+    report = dict(hashing=params['hashing'],
+                  terms_before=terms_before,
+                  ids_before=ids_before,
+                  ids_after=ids_after,
+                  model_bytes_saved=(ids_before - ids_after) * bytes_per_term,
+                  token_bytes_saved=token_bytes_saved)
+    logging.info('vocabulary: %i terms, %i ids before and %i ids after pruning, %.1f MB model and %.1f MB token memory saved',
+                 terms_before, ids_before, ids_after, report['model_bytes_saved'] / 1024 ** 2, token_bytes_saved / 1024 ** 2)
+    return report
+
+def save_report(report, path):
+    with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=2)